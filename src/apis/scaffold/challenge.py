@@ -21,7 +21,8 @@ def run(silence: Optional[bool] = None):
     )
 
     # [🌀] 激活人机挑战
-    if not bricklayer.cookie_manager.refresh_ctx_cookies(silence=silence):
+    # 手动更新身份令牌时不使用校验缓存
+    if not bricklayer.cookie_manager.refresh_ctx_cookies(silence=silence, force=True):
         return
 
     # [🌀] 读取新的身份令牌
@@ -10,9 +10,15 @@ from services.settings import logger
 
 
 @logger.catch()
-def deploy(platform: Optional[str] = None, unreal: Optional[bool] = False):
+def deploy(
+    platform: Optional[str] = None,
+    unreal: Optional[bool] = False,
+    adaptive: Optional[bool] = False,
+):
     """在微小容器中部署 `claim` 定时调度任务"""
-    ClaimerScheduler(silence=True, unreal=unreal).deploy_jobs(platform)
+    ClaimerScheduler(silence=True, unreal=unreal).deploy_jobs(
+        platform, adaptive=adaptive
+    )
 
 
 @logger.catch()
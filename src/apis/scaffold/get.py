@@ -4,14 +4,21 @@
 # Github     : https://github.com/QIN2DIM
 # Description:
 import random
+import time
 from typing import Optional
 
 from selenium.common.exceptions import WebDriverException
 
 from services.bricklayer import GameClaimer
 from services.explorer import Explorer
-from services.settings import logger
-from services.utils import CoroutineSpeedup, ToolBox, get_ctx
+from services.settings import logger, init_log
+from services.utils import (
+    CoroutineSpeedup,
+    ToolBox,
+    get_ctx_pool,
+    close_ctx_pool,
+    close_session,
+)
 
 SILENCE = True
 
@@ -40,10 +47,16 @@ class SpawnBooster(CoroutineSpeedup):
         if self.docker:
             random.shuffle(self.docker)
 
-    def control_driver(self, task, *args, **kwargs):
+    def control_driver(self, task, *args, **kwargs) -> Optional[str]:
+        """
+        领取常驻免费游戏
+
+        :param task: 商品页链接
+        :return: 在库判断或认领的结果
+        """
         url = task
 
-        # 运行前置检查
+        # 运行前置检查 已记入账本的资源不再请求商品页
         response = explorer.game_manager.is_my_game(
             ctx_cookies=self.ctx_cookies, page_link=url
         )
@@ -62,12 +75,18 @@ class SpawnBooster(CoroutineSpeedup):
 
             # 启动 Bricklayer 获取免费游戏
             try:
-                with get_ctx(silence=SILENCE) as ctx_session:
-                    bricklayer.claim_stabilizer(
+                with get_ctx_pool(silence=SILENCE).ctx() as ctx_session:
+                    result = bricklayer.claim_stabilizer(
                         page_link=url,
                         ctx_cookies=self.ctx_cookies,
                         ctx_session=ctx_session,
                     )
+                if result in [
+                    bricklayer.assert_.GAME_CLAIM,
+                    bricklayer.assert_.GAME_OK,
+                ]:
+                    explorer.game_manager.ledger.record(url, result)
+                return result
             except WebDriverException as error:
                 if self.debug:
                     logger.exception(error)
@@ -80,6 +99,10 @@ class SpawnBooster(CoroutineSpeedup):
                         url=url,
                     )
                 )
+                raise
+
+        # 已在库或无法认领的游戏
+        return response.get("assert")
 
     def killer(self):
         logger.success(
@@ -102,6 +125,8 @@ def join(trace: bool = False, cache: bool = True, category: str = "game"):
     """
     from gevent import monkey
 
+    # gevent 接管线程前将日志切换为同步写入
+    init_log(enqueue=False)
     monkey.patch_all(ssl=False)
 
     logger.info(
@@ -123,12 +148,35 @@ def join(trace: bool = False, cache: bool = True, category: str = "game"):
         return
 
     # [🔨] 缓存免费商城数据
+    # 缓存缺失时边搜集边领取，在库检查无需等待列表页全部解析完毕
     urls = explorer.game_manager.load_game_objs(category=category, only_url=True)
+    producer = None
     if not cache or not urls:
-        urls = explorer.discovery_free_games(
+        urls = None
+        producer = explorer.iter_free_games(
             ctx_cookies=ctx_cookies, cover=True, category=category
         )
 
     # [🔨] 启动 Bricklayer 搬空免费商店
     # 启动一轮协程任务，执行效率受限于本地网络带宽
-    SpawnBooster(ctx_cookies=ctx_cookies, docker=urls, power=4, debug=trace).speedup()
+    start = time.time()
+    try:
+        results = SpawnBooster(
+            ctx_cookies=ctx_cookies, docker=urls, power=4, debug=trace
+        ).speedup(producer=producer)
+    finally:
+        close_ctx_pool()
+        close_session()
+
+    claimed = [r for r in results if r["result"] == bricklayer.assert_.GAME_CLAIM]
+    logger.success(
+        ToolBox.runtime_report(
+            motive="OVER",
+            action_name="ScaffoldGet",
+            message="🍻 任务统计",
+            total=len(results),
+            claimed=len(claimed),
+            failed=len([r for r in results if r["status"] != SpawnBooster.TASK_DONE]),
+            cost=f"{round(time.time() - start, 1)}s",
+        )
+    )
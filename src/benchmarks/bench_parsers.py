@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/5/5 16:20
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description: 基于离线样本的解析器基准，输出单次解析耗时与内存峰值
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from os.path import dirname, join
+from typing import Any, Callable, Dict, List, Optional
+
+from bs4 import BeautifulSoup
+from fire import Fire
+
+PROJECT_SRC = dirname(dirname(os.path.abspath(__file__)))
+DIR_FIXTURES = join(dirname(os.path.abspath(__file__)), "fixtures")
+
+# 导入 services 时需通过账号配置校验，以占位变量避免进程退出
+os.environ.setdefault("EPΙC_EMAΙL", "benchmark@example.com")
+os.environ.setdefault("EPΙC_PASSWΟRD", "benchmark")
+sys.path.insert(0, PROJECT_SRC)
+
+from lxml import etree  # noqa: E402
+
+from services.bricklayer.core import AssertUtils  # noqa: E402
+from services.bricklayer.game import GameClaimer  # noqa: E402
+from services.bricklayer.unreal import UnrealClaimer  # noqa: E402
+from services.explorer.core import EpicAwesomeExplorer, GameLibManager  # noqa: E402
+from services.explorer.explorer import Explorer  # noqa: E402
+
+
+def load_fixture(name: str) -> bytes:
+    with open(join(DIR_FIXTURES, name), "rb") as file:
+        return file.read()
+
+
+def _promotions(raw: bytes):
+    return Explorer.parse_promotions(json.loads(raw))
+
+
+def _promotion_boundaries(raw: bytes):
+    return Explorer.parse_promotion_boundaries(json.loads(raw))
+
+
+def _promotion_deadlines(raw: bytes):
+    return Explorer.parse_promotion_deadlines(json.loads(raw))
+
+
+def _purchase_status(raw: bytes):
+    return GameLibManager.parse_purchase_status(etree.HTML(raw))
+
+
+def _dlc_page(raw: bytes):
+    return GameClaimer.parse_dlc_page(etree.HTML(raw))
+
+
+def _free_dlc_details(raw: bytes):
+    return GameClaimer.parse_free_dlc_details(
+        etree.HTML(raw),
+        "https://store.epicgames.com/zh-CN/p/free-game--dlc?priceTier=tierFree",
+    )
+
+
+def _empty_cart(raw: bytes):
+    return GameClaimer.parse_empty_cart(etree.HTML(raw))
+
+
+def _claimer_response(raw: bytes):
+    return UnrealClaimer.parse_claimer_response(raw)
+
+
+def _claimer_response_soup(raw: bytes):
+    """基于 html.parser 的原实现，作为流式解析的对照组"""
+    soup = BeautifulSoup(raw.decode("utf8"), "html.parser")
+    try:
+        articles = soup.find("div", class_="asset-list-group").find_all("article")
+    except AttributeError:
+        return None
+    return [
+        {
+            "name": article.find("h3").text,
+            "status": (
+                AssertUtils.GAME_OK
+                if "撰写评论" in article.text
+                else AssertUtils.GAME_PENDING
+            ),
+        }
+        for article in articles
+    ]
+
+
+def _stress_expressions(raw: bytes):
+    return EpicAwesomeExplorer.parse_stress_expressions(
+        etree.HTML(raw), EpicAwesomeExplorer.URL_STORE_HOME
+    )
+
+
+def _embedded_promotions(raw: bytes):
+    return EpicAwesomeExplorer.parse_embedded_promotions(etree.HTML(raw))
+
+
+def _store_home(raw: bytes):
+    """HTTP 降级链路的完整解析：卡片与内嵌状态数据共用一棵树"""
+    tree = etree.HTML(raw)
+    pending_games = EpicAwesomeExplorer.parse_stress_expressions(
+        tree, EpicAwesomeExplorer.URL_STORE_HOME
+    )
+    for url, title in EpicAwesomeExplorer.parse_embedded_promotions(tree).items():
+        pending_games.setdefault(url, title)
+    return pending_games
+
+
+# 商城首页样本中的周免游戏
+STORE_HOME_FREE = {
+    f"{EpicAwesomeExplorer.URL_PRODUCT_PAGE}free-weekly-1": "本周免费一",
+    f"{EpicAwesomeExplorer.URL_PRODUCT_PAGE}free-weekly-2": "本周免费二",
+}
+
+
+def _free_games(raw: bytes):
+    return EpicAwesomeExplorer.parse_free_games(
+        etree.HTML(raw), "https://store.epicgames.com/zh-CN/free-games"
+    )
+
+
+# (用例名, 样本文件, 解析函数, 结果校验)
+CASES: List[tuple] = [
+    (
+        "get_promotions",
+        "promotions.json",
+        _promotions,
+        lambda r: len(r["urls"]) == 3,
+    ),
+    (
+        "promotion_boundaries",
+        "promotions.json",
+        _promotion_boundaries,
+        lambda r: r == ["2022-05-12T15:00:00.000Z"],
+    ),
+    (
+        "promotion_deadlines",
+        "promotions.json",
+        _promotion_deadlines,
+        lambda r: len(r) == 3 and set(r.values()) == {"2022-05-12T15:00:00.000Z"},
+    ),
+    (
+        "is_my_game:owned",
+        "product_owned.html",
+        _purchase_status,
+        lambda r: r["status"] is True,
+    ),
+    (
+        "is_my_game:get",
+        "product_get.html",
+        _purchase_status,
+        lambda r: r["status"] is False,
+    ),
+    (
+        "is_my_game:mature",
+        "product_mature.html",
+        _purchase_status,
+        lambda r: r["status"] is False and r["warning"],
+    ),
+    (
+        "is_my_game:upcoming",
+        "product_upcoming.html",
+        _purchase_status,
+        lambda r: r["status"] is True and r["assert"] == "即将推出",
+    ),
+    (
+        "dlc_entry",
+        "product_get.html",
+        _dlc_page,
+        lambda r: r and "free-game--dlc" in r,
+    ),
+    (
+        "free_dlc_details",
+        "dlc_free.html",
+        _free_dlc_details,
+        lambda r: len(r) == 12,
+    ),
+    (
+        "free_dlc_details:empty",
+        "dlc_empty.html",
+        _free_dlc_details,
+        lambda r: r == [],
+    ),
+    ("cart:empty", "cart_empty.html", _empty_cart, lambda r: r is True),
+    ("cart:items", "cart_items.html", _empty_cart, lambda r: r is False),
+    (
+        "unreal_claimer_response",
+        "unreal_month.html",
+        _claimer_response,
+        lambda r: r == _claimer_response_soup(load_fixture("unreal_month.html"))
+        and [i["status"] for i in r].count(AssertUtils.GAME_OK) == 2,
+    ),
+    (
+        "unreal_claimer_response:soup",
+        "unreal_month.html",
+        _claimer_response_soup,
+        lambda r: r is not None and len(r) == 5,
+    ),
+    (
+        "unreal_claimer_response:miss",
+        "cart_empty.html",
+        _claimer_response,
+        lambda r: r is None
+        and _claimer_response_soup(load_fixture("cart_empty.html")) is None,
+    ),
+    (
+        "stress_expressions:cards",
+        "store_home.html",
+        _stress_expressions,
+        lambda r: r == STORE_HOME_FREE,
+    ),
+    (
+        "stress_expressions:state",
+        "store_home.html",
+        _embedded_promotions,
+        lambda r: r == STORE_HOME_FREE,
+    ),
+    (
+        "stress_expressions:store_home",
+        "store_home.html",
+        _store_home,
+        lambda r: r == STORE_HOME_FREE,
+    ),
+    (
+        "stress_expressions:csr",
+        "store_home_state.html",
+        _store_home,
+        lambda r: r == STORE_HOME_FREE,
+    ),
+    (
+        "stress_expressions:miss",
+        "cart_empty.html",
+        _store_home,
+        lambda r: r == {},
+    ),
+    (
+        "discovery_free_games",
+        "free_games_page.html",
+        _free_games,
+        lambda r: len(r[0]) == 40 and r[1].endswith("start=80&count=40"),
+    ),
+]
+
+
+def measure(func: Callable, raw: bytes, rounds: int) -> Dict[str, Any]:
+    """
+    测量解析耗时与内存峰值
+
+    :param func: 解析函数
+    :param raw: 样本数据
+    :param rounds: 计时轮数
+    :return:
+    """
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(raw)
+        samples.append(time.perf_counter() - start)
+
+    # tracemalloc 会拖慢解析，与计时分开执行
+    # 仅统计 Python 堆上的分配，不含 libxml2 内部内存
+    tracemalloc.start()
+    try:
+        result = func(raw)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "result": result,
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run(rounds: int = 30, only: Optional[str] = None, output: Optional[str] = None):
+    """
+    离线解析器基准测试
+
+    :param rounds: 每个用例的计时轮数
+    :param only: 仅执行名称包含该关键字的用例
+    :param output: 将测量结果以 JSON 格式写入该路径，便于对比解析器改动前后的表现
+    :return:
+    """
+    report, failures = {}, []
+    print(f"{'case':<32}{'size':>10}{'min':>10}{'median':>10}{'peak':>12}")
+    for name, fixture, func, check in CASES:
+        if only and only not in name:
+            continue
+        raw = load_fixture(fixture)
+        stats = measure(func, raw, max(int(rounds), 1))
+        passed = bool(check(stats.pop("result")))
+        if not passed:
+            failures.append(name)
+        report[name] = {"fixture": fixture, "bytes": len(raw), **stats}
+        print(
+            f"{name:<32}{len(raw) / 1024:>8.1f}KB"
+            f"{stats['min_ms']:>8.2f}ms{stats['median_ms']:>8.2f}ms"
+            f"{stats['peak_kib']:>9.1f}KiB{'' if passed else '  [MISMATCH]'}"
+        )
+
+    if output:
+        with open(output, "w", encoding="utf8") as file:
+            json.dump(report, file, indent=2)
+    if failures:
+        print(f"[FAIL] unexpected parse results: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    Fire(run)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/5/3 10:12
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description: 基于 `python -X importtime` 的冷启动基准，启动耗时劣化时以非零状态码退出
+import os
+import subprocess
+import sys
+from os.path import dirname
+from typing import List, Tuple
+
+from fire import Fire
+
+PROJECT_SRC = dirname(dirname(os.path.abspath(__file__)))
+
+# 脚手架入口不应在模块加载阶段触碰的重量级依赖
+HEAVY_MODULES = (
+    "selenium",
+    "undetected_chromedriver",
+    "webdriver_manager",
+    "cv2",
+    "skimage",
+    "scipy",
+    "gevent",
+    "aiohttp",
+    "apprise",
+    "cloudscraper",
+)
+
+# {入口模块: 冷启动耗时预算(ms)}
+BUDGETS = {"main": 400, "services.scaffold": 150, "services.utils": 150}
+
+
+def measure(module: str) -> Tuple[float, List[str]]:
+    """
+    在独立解释器中冷启动导入目标模块
+
+    :param module: 入口模块
+    :return: (累计导入耗时 ms, 已导入的模块列表)
+    """
+    env = dict(os.environ)
+    # 部分模块在导入时校验账号配置，以占位变量避免进程退出
+    env.setdefault("EPΙC_EMAΙL", "benchmark@example.com")
+    env.setdefault("EPΙC_PASSWΟRD", "benchmark")
+    env["PYTHONPATH"] = PROJECT_SRC
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_SRC,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us, modules = 0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            cumulative = int(cumulative)
+        except ValueError:
+            continue
+        modules.append(name.strip())
+        # 顶层导入项的累计耗时之和即冷启动总耗时
+        if not name[1:].startswith(" "):
+            total_us += cumulative
+    return total_us / 1000, modules
+
+
+def run(rounds: int = 3, scale: float = 1.0):
+    """
+    冷启动基准测试
+
+    :param rounds: 每个入口重复测量次数，取最小值
+    :param scale: 预算缩放系数，用于适配性能较弱的 CI 机器
+    :return:
+    """
+    failures = []
+    for module, budget in BUDGETS.items():
+        budget *= scale
+        samples = [measure(module) for _ in range(max(int(rounds), 1))]
+        elapsed = min(sample[0] for sample in samples)
+        heavy = sorted(set(samples[0][1]) & set(HEAVY_MODULES))
+        status = "PASS" if elapsed <= budget and not heavy else "FAIL"
+        print(f"[{status}] {module:<20} {elapsed:>8.1f}ms / budget {budget:.0f}ms")
+        if heavy:
+            print(f"       heavy imports: {', '.join(heavy)}")
+        if status == "FAIL":
+            failures.append(module)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    Fire(run)
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/5/13 19:05
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description: 本地替身商城，以离线样本模拟 Epic 商城的接口，用于端到端的性能回归
+import hashlib
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import dirname, join
+from typing import Optional, Dict, Any, Tuple, List
+from urllib.parse import urlparse
+
+from fire import Fire
+
+PROJECT_SRC = dirname(dirname(os.path.abspath(__file__)))
+DIR_FIXTURES = join(dirname(os.path.abspath(__file__)), "fixtures")
+
+# 替身服务器可视为已登录的身份令牌
+CTX_COOKIES = [
+    {"name": "EPIC_SESSION_AP", "value": "stand-in"},
+    {"name": "EPIC_BEARER_TOKEN", "value": "stand-in"},
+]
+
+
+class StandInStore:
+    """
+    替身商城的路由与故障注入
+
+    各主机的路径互不冲突，所有 `URL_*` 重定向至同一个 base_url 后按路径分发：
+
+    - /freeGamesPromotions       促销接口，支持 ETag 条件请求
+    - /zh-CN/                    商城首页
+    - /zh-CN/browse              免费游戏/附加内容列表页
+    - /zh-CN/p/{slug}            商品页，按 owned_ratio 决定在库状态
+    - /zh-CN/cart                购物车
+    - /account/personal          个人页，未携带身份令牌时重定向至登录页
+    - /marketplace/zh-CN/assets  虚幻商城月供内容
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 502,
+        owned_ratio: float = 0.8,
+        seed: int = 0,
+    ):
+        """
+
+        :param latency: 每个请求的固定延迟（秒）
+        :param jitter: 在固定延迟上叠加的随机延迟上限（秒）
+        :param error_rate: 注入错误响应的概率
+        :param error_status: 注入的错误状态码，502 会触发 NetworkSession 的退避重试
+        :param owned_ratio: 商品页呈现为已在库的比例
+        :param seed: 随机种子，相同参数下的多次运行注入的故障一致
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.owned_ratio = owned_ratio
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._fixtures: Dict[str, bytes] = {}
+        self.stats: Dict[str, int] = {}
+
+    def fixture(self, name: str) -> bytes:
+        if name not in self._fixtures:
+            with open(join(DIR_FIXTURES, name), "rb") as file:
+                self._fixtures[name] = file.read()
+        return self._fixtures[name]
+
+    def _product(self, slug: str) -> str:
+        if slug.endswith("--dlc"):
+            return "dlc_free.html"
+        if "mature" in slug:
+            return "product_mature.html"
+        # 以链接的摘要决定在库状态，保证多次运行的结果一致
+        if zlib.crc32(slug.encode("utf8")) % 100 < self.owned_ratio * 100:
+            return "product_owned.html"
+        return "product_get.html"
+
+    def route(
+        self, path: str, query: str, headers
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        :return: (status, headers, body)
+        """
+        html = {"content-type": "text/html; charset=utf-8"}
+
+        if path == "/freeGamesPromotions":
+            body = self.fixture("promotions.json")
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            if headers.get("if-none-match") == etag:
+                return 304, {"etag": etag}, b""
+            return 200, {"content-type": "application/json", "etag": etag}, body
+        if path == "/zh-CN/":
+            return 200, html, self.fixture("store_home.html")
+        if path == "/zh-CN/browse":
+            if "GameAddOn" in query:
+                return 200, html, self.fixture("dlc_free.html")
+            return 200, html, self.fixture("free_games_page.html")
+        if path.startswith("/zh-CN/p/"):
+            slug = path[len("/zh-CN/p/") :].strip("/")
+            return 200, html, self.fixture(self._product(slug))
+        if path == "/zh-CN/cart":
+            return 200, html, self.fixture("cart_empty.html")
+        if path == "/account/personal":
+            if not headers.get("cookie"):
+                return 302, {"location": "/id/login"}, b""
+            return 200, html, b"<html><body><h1>Account</h1></body></html>"
+        if path == "/marketplace/zh-CN/assets":
+            return 200, html, self.fixture("unreal_month.html")
+        return 404, html, b""
+
+    def handle(
+        self, path: str, query: str, headers
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        # 商品页按路由计数
+        key = "/zh-CN/p/*" if path.startswith("/zh-CN/p/") else path
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            with self._lock:
+                self.stats["<injected>"] = self.stats.get("<injected>", 0) + 1
+            return self.error_status, {"content-type": "text/plain"}, b"injected"
+        return self.route(path, query, headers)
+
+
+def create_server(
+    store: StandInStore, host: str = "127.0.0.1", port: int = 0
+) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):  # noqa
+            parsed = urlparse(self.path)
+            status, headers, body = store.handle(
+                parsed.path, parsed.query, self.headers
+            )
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    error_status: int = 502,
+    owned_ratio: float = 0.8,
+    seed: int = 0,
+):
+    """
+    启动替身商城
+
+    另开终端设置 EPIC_BASE_URL=http://{host}:{port} 后运行项目即可将全部 HTTP 请求指向替身商城。
+    """
+    store = StandInStore(latency, jitter, error_rate, error_status, owned_ratio, seed)
+    server = create_server(store, host, port)
+    print(f"[STAND-IN] serving on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(store.stats, indent=2))
+
+
+def _cancel_streaming() -> bool:
+    """
+    流式投递时由任务取消整轮运行
+
+    producer 阻塞于满载的有界队列时 speedup() 仍需返回，未执行的任务记为 cancelled。
+    """
+    import gevent
+    from services.utils import CoroutineSpeedup
+
+    class Canceller(CoroutineSpeedup):
+        def control_driver(self, task, *args, **kwargs):
+            # 让出执行权，producer 填满队列后阻塞于投递
+            gevent.sleep(0.01)
+            if task == 0:
+                self.cancel()
+            return task
+
+    booster = Canceller(power=2)
+    results = gevent.with_timeout(
+        5, booster.speedup, producer=iter(range(100)), timeout_value=None
+    )
+    return (
+        results is not None
+        and len(results) == booster.max_queue_size
+        and any(r["status"] == booster.TASK_CANCELLED for r in results)
+    )
+
+
+def _pipeline(power: int) -> Tuple[Dict[str, float], List[str]]:
+    """
+    以替身商城执行一轮无浏览器的完整链路，返回各阶段耗时与未通过的校验
+
+    运行缓存写入临时目录，每一轮都是冷启动。
+    """
+    from services.bricklayer import GameClaimer, UnrealClaimer
+    from services.explorer import Explorer
+    from services.explorer.ledger import ClaimLedger
+
+    workspace = tempfile.mkdtemp(prefix="stand-in-")
+    timing: Dict[str, float] = {}
+    failures: List[str] = []
+
+    def stage(name, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timing[name] = round(time.perf_counter() - start, 4)
+        return result
+
+    try:
+        explorer = Explorer()
+        explorer.path_promotions = join(workspace, "promotions.json")
+        explorer.path_free_games = join(workspace, "ctx_store.yaml")
+        explorer.game_manager.path_free_games = explorer.path_free_games
+        explorer.game_manager.ledger = ClaimLedger(
+            join(workspace, "ledger.db"), account="stand-in"
+        )
+        bricklayer = GameClaimer()
+        bricklayer.path_dlc_cache = join(workspace, "dlc_details.json")
+        bricklayer.cookie_manager.path_ctx_cookies_check = join(
+            workspace, "ctx_cookies_check.json"
+        )
+        unreal = UnrealClaimer()
+
+        start = time.perf_counter()
+        stage(
+            "cookie_check",
+            bricklayer.cookie_manager.is_available_cookie,
+            CTX_COOKIES,
+            force=True,
+        )
+        promotions = stage("promotions", explorer.get_promotions, CTX_COOKIES)
+        boundaries = explorer.promotion_boundaries
+        deadlines = explorer.promotion_deadlines
+
+        # 条件请求命中时直接返回缓存，不再解码与解析促销数据
+        decoded = []
+
+        def parse_promotions(data, _parse=explorer.parse_promotions):
+            decoded.append(data)
+            return _parse(data)
+
+        explorer.parse_promotions = parse_promotions
+        explorer.promotion_boundaries, explorer.promotion_deadlines = [], {}
+        cached = stage("promotions:304", explorer.get_promotions, CTX_COOKIES)
+        del explorer.parse_promotions
+        if not (
+            explorer._load_promotions_cache().get("etag")  # noqa
+            and not decoded
+            and cached == promotions
+            and explorer.promotion_boundaries == boundaries
+            and explorer.promotion_deadlines == deadlines
+        ):
+            failures.append("promotions:304")
+        stage("store_home", explorer.get_promotions_by_store_home)
+        urls = stage(
+            "discovery", explorer.discovery_free_games, ctx_cookies=CTX_COOKIES
+        )
+
+        def check(url):
+            return explorer.game_manager.is_my_game(CTX_COOKIES, url)
+
+        with ThreadPoolExecutor(max_workers=power) as executor:
+            stage("is_my_game", lambda: list(executor.map(check, urls)))
+            stage(
+                "dlc_details",
+                lambda: list(
+                    executor.map(
+                        lambda url: bricklayer.get_free_dlc_details(url, CTX_COOKIES),
+                        promotions["urls"],
+                    )
+                ),
+            )
+        stage("cart", bricklayer.is_empty_cart, CTX_COOKIES)
+        stage("unreal", unreal.get_claimer_response, CTX_COOKIES)
+        timing["total"] = round(time.perf_counter() - start, 4)
+
+        if not stage("speedup:cancel", _cancel_streaming):
+            failures.append("speedup:cancel")
+
+        explorer.game_manager.ledger.close()
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    return timing, failures
+
+
+def run(
+    rounds: int = 3,
+    power: int = 4,
+    latency: float = 0.02,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    error_status: int = 502,
+    owned_ratio: float = 0.8,
+    seed: int = 0,
+    output: Optional[str] = None,
+):
+    """
+    启动替身商城并计时完整的无浏览器链路
+
+    :param rounds: 运行轮数
+    :param power: 在库检查的并发数
+    :param latency: 替身商城的固定延迟（秒）
+    :param jitter: 随机延迟上限（秒）
+    :param error_rate: 注入错误响应的概率
+    :param error_status: 注入的错误状态码
+    :param owned_ratio: 商品页呈现为已在库的比例
+    :param seed: 随机种子
+    :param output: 将测量结果以 JSON 格式写入该路径，便于对比改动前后的表现
+    :return:
+    """
+    store = StandInStore(latency, jitter, error_rate, error_status, owned_ratio, seed)
+    server = create_server(store)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # 服务模块在导入时读取 EPIC_BASE_URL，需先于导入设置
+    os.environ["EPIC_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ.setdefault("EPΙC_EMAΙL", "benchmark@example.com")
+    os.environ.setdefault("EPΙC_PASSWΟRD", "benchmark")
+    sys.path.insert(0, PROJECT_SRC)
+
+    from services.settings import logger
+    from services.utils import close_session
+
+    logger.remove()
+
+    samples, failures = [], set()
+    try:
+        for _ in range(max(int(rounds), 1)):
+            timing, failed = _pipeline(max(int(power), 1))
+            samples.append(timing)
+            failures.update(failed)
+    finally:
+        summary = close_session() or {}
+        server.shutdown()
+        server.server_close()
+
+    report: Dict[str, Any] = {
+        name: {
+            "min_ms": round(min(s[name] for s in samples) * 1000, 1),
+            "median_ms": round(statistics.median(s[name] for s in samples) * 1000, 1),
+        }
+        for name in samples[0]
+    }
+    print(f"{'stage':<20}{'min':>12}{'median':>12}")
+    for name, stats in report.items():
+        print(f"{name:<20}{stats['min_ms']:>10.1f}ms{stats['median_ms']:>10.1f}ms")
+    print(
+        f"[STAND-IN] requests={json.dumps(store.stats)} session={json.dumps(summary)}"
+    )
+
+    if output:
+        report["requests"], report["session"] = store.stats, summary
+        with open(output, "w", encoding="utf8") as file:
+            json.dump(report, file, indent=2)
+    if failures:
+        print(f"[FAIL] unexpected results: {', '.join(sorted(failures))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    Fire({"serve": serve, "run": run})
@@ -3,7 +3,20 @@
 # Author     : QIN2DIM
 # Github     : https://github.com/QIN2DIM
 # Description:
-from .game import GameClaimer
-from .unreal import UnrealClaimer
+import importlib
+
+_LAZY_EXPORTS = {"GameClaimer": ".game", "UnrealClaimer": ".unreal"}
 
 __all__ = ["GameClaimer", "UnrealClaimer"]
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_EXPORTS))
@@ -3,14 +3,13 @@
 # Author     : QIN2DIM
 # Github     : https://github.com/QIN2DIM
 # Description:
-import asyncio
+import json
 import json.decoder
 import os
-import sys
 import time
 import urllib.request
 from hashlib import sha256
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from typing import NoReturn
 
 import cloudscraper
@@ -40,14 +39,12 @@ from services.settings import (
     PATH_RAINBOW,
 )
 from services.utils import (
-    YOLO,
-    sk_recognition,
     ToolBox,
     ArmorCaptcha,
-    AshFramework,
     ChallengeReset,
+    rebase_urls,
 )
-from services.utils import get_challenge_ctx, ChallengeTimeout
+from services.utils import get_challenge_ctx, get_session, ChallengeTimeout, traced
 from .exceptions import (
     AssertTimeout,
     UnableToGet,
@@ -69,7 +66,16 @@ class ArmorUtils(ArmorCaptcha):
         super().__init__(dir_workspace=DIR_CHALLENGE, debug=debug)
 
         # 重定向工作空间
-        self.model = YOLO(DIR_MODEL)
+        self._model = None
+
+    @property
+    def model(self):
+        """YOLO 模型在首次遇到人机挑战时加载"""
+        if self._model is None:
+            from services.utils import YOLO
+
+            self._model = YOLO(DIR_MODEL)
+        return self._model
 
     @staticmethod
     def fall_in_captcha_login(ctx: Chrome) -> Optional[bool]:
@@ -157,6 +163,8 @@ class ArmorUtils(ArmorCaptcha):
 
     def switch_solution(self, mirror, label: Optional[str] = None):
         """模型卸载"""
+        from services.utils import sk_recognition
+
         label = self.label if label is None else label
 
         if label in ["垂直河流"]:
@@ -174,12 +182,13 @@ class ArmorUtils(ArmorCaptcha):
 
         :return:
         """
+        from services.utils import AshFramework
 
         class ImageDownloader(AshFramework):
             """协程助推器 提高挑战图片的下载效率"""
 
             def __init__(self, docker=None):
-                super().__init__(docker=docker)
+                super().__init__(docker=docker, task_timeout=10, timeout=30)
 
             async def control_driver(self, context, session=None):
                 path_challenge_img, url = context
@@ -202,13 +211,13 @@ class ArmorUtils(ArmorCaptcha):
             docker_.append((path_challenge_img_, url_))
 
         # 启动最高功率的协程任务
-        if "win" in sys.platform:
-            asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-            asyncio.run(ImageDownloader(docker=docker_).subvert(workers="fast"))
-        else:
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(
-                ImageDownloader(docker=docker_).subvert(workers="fast")
+        downloader = ImageDownloader(docker=docker_)
+        downloader.run(workers="fast")
+        if downloader.exceptions:
+            self.log(
+                message="挑战图片下载失败",
+                progress=downloader.progress(),
+                failed=len(downloader.exceptions),
             )
 
         self.runtime_workspace = workspace_
@@ -719,6 +728,7 @@ class AssertUtils:
             ).click()
 
 
+@rebase_urls
 class EpicAwesomeGamer:
     """白嫖人的基础设施"""
 
@@ -1108,13 +1118,22 @@ class EpicAwesomeGamer:
 class CookieManager(EpicAwesomeGamer):
     """管理上下文身份令牌"""
 
+    # 身份令牌校验结果的有效期（秒）
+    CHECK_TTL = 6 * 3600
+
     def __init__(self, auth_str):
         super().__init__()
 
         self.action_name = "CookieManager"
         self.auth_str = auth_str
-        self.path_ctx_cookies = os.path.join(DIR_COOKIES, "ctx_cookies.yaml")
+        self.path_ctx_cookies = os.path.join(DIR_COOKIES, "ctx_cookies.json")
+        self.path_ctx_cookies_legacy = os.path.join(DIR_COOKIES, "ctx_cookies.yaml")
+        self.path_ctx_cookies_check = os.path.join(
+            DIR_COOKIES, "ctx_cookies_check.json"
+        )
         self.ctx_session = None
+        # 身份令牌存储快照 (st_mtime_ns, store)
+        self._store_snapshot = ()
 
     def _t(self) -> str:
         return (
@@ -1123,15 +1142,52 @@ class CookieManager(EpicAwesomeGamer):
             else ""
         )
 
-    def load_ctx_cookies(self) -> Optional[List[dict]]:
-        """载入本地缓存的身份令牌"""
-        if not os.path.exists(self.path_ctx_cookies):
-            return []
+    def _migrate_ctx_cookies(self) -> None:
+        """将旧版 YAML 身份令牌迁移至 JSON 存储，原文件重命名为 .bak"""
+        if os.path.exists(self.path_ctx_cookies) or not os.path.exists(
+            self.path_ctx_cookies_legacy
+        ):
+            return
 
-        with open(self.path_ctx_cookies, "r", encoding="utf8") as file:
-            data: dict = yaml.safe_load(file)
+        with open(self.path_ctx_cookies_legacy, "r", encoding="utf8") as file:
+            data = yaml.safe_load(file)
+        ToolBox.atomic_write(
+            self.path_ctx_cookies,
+            json.dumps(data if isinstance(data, dict) else {}, separators=(",", ":")),
+        )
+        os.replace(self.path_ctx_cookies_legacy, f"{self.path_ctx_cookies_legacy}.bak")
 
-        ctx_cookies = data.get(self._t(), []) if isinstance(data, dict) else []
+        logger.debug(
+            ToolBox.runtime_report(
+                motive="MIGRATE",
+                action_name=self.action_name,
+                message="Migrate context cookie store to JSON.",
+                path=self.path_ctx_cookies,
+            )
+        )
+
+    def _load_cookie_store(self) -> Dict[str, List[dict]]:
+        """读取身份令牌存储，文件未变更时复用内存中的解析结果"""
+        self._migrate_ctx_cookies()
+        try:
+            mtime = os.stat(self.path_ctx_cookies).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self._store_snapshot and self._store_snapshot[0] == mtime:
+            return self._store_snapshot[-1]
+
+        try:
+            with open(self.path_ctx_cookies, "r", encoding="utf8") as file:
+                data = json.load(file)
+        except json.decoder.JSONDecodeError:
+            data = {}
+        store = data if isinstance(data, dict) else {}
+        self._store_snapshot = (mtime, store)
+        return store
+
+    def load_ctx_cookies(self) -> Optional[List[dict]]:
+        """载入本地缓存的身份令牌"""
+        ctx_cookies = self._load_cookie_store().get(self._t(), [])
         if not ctx_cookies:
             return []
 
@@ -1147,17 +1203,13 @@ class CookieManager(EpicAwesomeGamer):
 
     def save_ctx_cookies(self, ctx_cookies: List[dict]) -> None:
         """在本地缓存身份令牌"""
-        _data = {}
-
-        if os.path.exists(self.path_ctx_cookies):
-            with open(self.path_ctx_cookies, "r", encoding="utf8") as file:
-                stream: dict = yaml.safe_load(file)
-                _data = _data if not isinstance(stream, dict) else stream
-
+        _data = dict(self._load_cookie_store())
         _data.update({self._t(): ctx_cookies})
 
-        with open(self.path_ctx_cookies, "w", encoding="utf8") as file:
-            yaml.dump(_data, file)
+        ToolBox.atomic_write(
+            self.path_ctx_cookies, json.dumps(_data, separators=(",", ":"))
+        )
+        self._store_snapshot = ()
 
         logger.debug(
             ToolBox.runtime_report(
@@ -1167,35 +1219,108 @@ class CookieManager(EpicAwesomeGamer):
             )
         )
 
-    def is_available_cookie(self, ctx_cookies: Optional[List[dict]] = None) -> bool:
-        """检测 Cookie 是否有效"""
+    @staticmethod
+    def _fingerprint(ctx_cookies: List[dict]) -> str:
+        return sha256(ToolBox.transfer_cookies(ctx_cookies).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _earliest_expiry(ctx_cookies: List[dict]) -> Optional[float]:
+        """身份令牌中最先过期的 cookie 的过期时刻，优先参考 EPIC_ 前缀的认证字段"""
+        expiry_seq = [c["expiry"] for c in ctx_cookies if c.get("expiry")]
+        auth_expiry_seq = [
+            c["expiry"]
+            for c in ctx_cookies
+            if c.get("expiry") and str(c.get("name", "")).startswith("EPIC_")
+        ]
+        expiry_seq = auth_expiry_seq or expiry_seq
+        return min(expiry_seq) if expiry_seq else None
+
+    def _load_cookie_checks(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path_ctx_cookies_check, "r", encoding="utf8") as file:
+                checks = json.load(file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return {}
+        return checks if isinstance(checks, dict) else {}
+
+    def _save_cookie_check(self, ctx_cookies: Optional[List[dict]]) -> None:
+        """记录身份令牌的校验结果，传入空值时清除记录"""
+        checks = self._load_cookie_checks()
+        if ctx_cookies:
+            checks[self._t()] = {
+                "fingerprint": self._fingerprint(ctx_cookies),
+                "checked_at": time.time(),
+                "expiry": self._earliest_expiry(ctx_cookies),
+            }
+        elif checks.pop(self._t(), None) is None:
+            return
+        ToolBox.atomic_write(self.path_ctx_cookies_check, json.dumps(checks))
+
+    def _is_verified(self, ctx_cookies: List[dict]) -> bool:
+        """身份令牌在有效期内通过校验且尚未过期"""
+        check = self._load_cookie_checks().get(self._t())
+        if not check or check.get("fingerprint") != self._fingerprint(ctx_cookies):
+            return False
+        now = time.time()
+        if now - check.get("checked_at", 0) > self.CHECK_TTL:
+            return False
+        return not check.get("expiry") or now < check["expiry"] - 60
+
+    def is_available_cookie(
+        self, ctx_cookies: Optional[List[dict]] = None, force: Optional[bool] = False
+    ) -> bool:
+        """
+        检测 Cookie 是否有效
+
+        在 CHECK_TTL 内校验通过且尚未过期的身份令牌不再发起网络请求。
+        :param ctx_cookies:
+        :param force: 忽略校验缓存，强制访问个人页面校验身份令牌
+        :return:
+        """
         ctx_cookies = self.load_ctx_cookies() if ctx_cookies is None else ctx_cookies
         if not ctx_cookies:
             return False
 
+        if not force and self._is_verified(ctx_cookies):
+            logger.debug(
+                ToolBox.runtime_report(
+                    motive="CHECK",
+                    action_name=self.action_name,
+                    message="Use cached identity token validation.",
+                )
+            )
+            return True
+
         headers = {"cookie": ToolBox.transfer_cookies(ctx_cookies)}
 
-        scraper = cloudscraper.create_scraper()
-        response = scraper.get(
+        response = get_session().get(
             self.URL_ACCOUNT_PERSONAL, headers=headers, allow_redirects=False
         )
 
         if response.status_code == 200:
+            self._save_cookie_check(ctx_cookies)
             return True
+        self._save_cookie_check(None)
         return False
 
+    @traced("cookie_refresh")
     def refresh_ctx_cookies(
-        self, silence: bool = True, ctx_session=None, keep_live=None
+        self,
+        silence: bool = True,
+        ctx_session=None,
+        keep_live=None,
+        force: Optional[bool] = False,
     ) -> Optional[bool]:
         """
         更新上下文身份信息，若认证数据过期则弹出 login 任务更新令牌。
         :param keep_live: keep actively to the challenger context
         :param ctx_session:
         :param silence:
+        :param force: 忽略校验缓存，强制校验身份令牌
         :return:
         """
         # {{< Check Context Cookie Validity >}}
-        if self.is_available_cookie():
+        if self.is_available_cookie(force=force):
             logger.success(
                 ToolBox.runtime_report(
                     motive="CHECK",
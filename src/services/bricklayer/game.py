@@ -3,11 +3,16 @@
 # Author     : QIN2DIM
 # Github     : https://github.com/QIN2DIM
 # Description:
+import json
+import os
+import threading
 import time
-from typing import List, Optional, Dict, Union
+from datetime import datetime
+from json.decoder import JSONDecodeError
+from typing import List, Optional, Dict, Union, Any, Tuple
 
-from services.settings import logger
-from services.utils import ToolBox
+from services.settings import logger, DIR_EXPLORER
+from services.utils import ToolBox, traced, rebase_urls, xpaths
 from .core import EpicAwesomeGamer, CookieManager
 from .exceptions import (
     AssertTimeout,
@@ -19,11 +24,16 @@ from .exceptions import (
 )
 
 
+@rebase_urls
 class GameClaimer(EpicAwesomeGamer):
     """性能更高的调度策略"""
 
     URL_GAME_CART = "https://store.epicgames.com/zh-CN/cart"
 
+    # 免费附加内容缓存的有效期 促销结束时刻未知时使用 DLC_CACHE_TTL
+    DLC_CACHE_TTL = 24 * 3600
+    DLC_CACHE_MAX_TTL = 7 * 24 * 3600
+
     def __init__(self, silence: bool = None, claim_mode: str = None):
         super().__init__()
         self.silence = True if silence is None else silence
@@ -36,37 +46,136 @@ class GameClaimer(EpicAwesomeGamer):
         self.action_name = "GameClaimer"
         self.cookie_manager = CookieManager(auth_str=self.AUTH_STR_GAMES)
 
+        # 免费附加内容缓存 {ctx_url: {"expires_at": timestamp, "dlc": [...]}}
+        self.path_dlc_cache = os.path.join(DIR_EXPLORER, "dlc_details.json")
+        self._dlc_cache: Optional[Dict[str, Dict[str, Any]]] = None
+        self._dlc_cache_lock = threading.Lock()
+
+    def _load_dlc_cache(self) -> Dict[str, Dict[str, Any]]:
+        if self._dlc_cache is None:
+            try:
+                with open(self.path_dlc_cache, "r", encoding="utf8") as file:
+                    self._dlc_cache = json.load(file)
+            except (FileNotFoundError, JSONDecodeError):
+                self._dlc_cache = {}
+        return self._dlc_cache
+
+    def _dlc_cache_expiry(self, deadline: Optional[str] = None) -> float:
+        """缓存有效期不超过促销结束时刻，促销结束时刻未知时使用缺省的有效期"""
+        now = time.time()
+        if not deadline:
+            return now + self.DLC_CACHE_TTL
+        try:
+            end = datetime.fromisoformat(deadline.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return now + self.DLC_CACHE_TTL
+        return min(end, now + self.DLC_CACHE_MAX_TTL)
+
     def get_free_dlc_details(
-        self, ctx_url: str, ctx_cookies: List[dict]
+        self,
+        ctx_url: str,
+        ctx_cookies: List[dict],
+        scraper=None,
+        deadline: Optional[str] = None,
     ) -> List[Dict[str, Union[str, bool]]]:
         """
         1. 检测一个游戏实体是否存在免费附加内容
         2. 将可领取的免费附加内容编织成任务对象并返回
         3. 一个游戏实体可能存在多个可领取的免费DLC
+
+        促销期内游戏的免费附加内容几乎不变，解析结果按商品链接缓存至促销结束。
+        商品页或附加内容列表页被拦截时解析结果不可信，不写入缓存。
         :param ctx_url: 游戏本体商城链接
         :param ctx_cookies:
+        :param scraper: 复用的 HTTP 会话，缺省时使用进程共享的会话
+        :param deadline: 促销结束时刻 ISO 8601，缓存不会跨越该时刻
         :return: [{"url": url of dlc, "name": name of dlc, "dlc": True}, ... ]
         """
+        with self._dlc_cache_lock:
+            entry = self._load_dlc_cache().get(ctx_url)
+        if entry and entry.get("expires_at", 0) > time.time():
+            return [dict(dlc) for dlc in entry["dlc"]]
+
+        dlc_details, cacheable = self._fetch_free_dlc_details(
+            ctx_url, ctx_cookies, scraper
+        )
+
+        expires_at = self._dlc_cache_expiry(deadline)
+        if cacheable and expires_at > time.time():
+            with self._dlc_cache_lock:
+                now = time.time()
+                cache = {
+                    url: entry
+                    for url, entry in self._load_dlc_cache().items()
+                    if entry.get("expires_at", 0) > now
+                }
+                cache[ctx_url] = {"expires_at": expires_at, "dlc": dlc_details}
+                self._dlc_cache = cache
+                ToolBox.atomic_write(
+                    self.path_dlc_cache, json.dumps(cache, ensure_ascii=False)
+                )
+        return [dict(dlc) for dlc in dlc_details]
+
+    def _fetch_free_dlc_details(
+        self, ctx_url: str, ctx_cookies: List[dict], scraper=None
+    ) -> Tuple[List[Dict[str, Union[str, bool]]], bool]:
+        """
+        :return: (附加内容列表, 解析结果是否可以缓存)
+        """
         # [🚀] 检测当前商品是否有DLC
         cookie = ToolBox.transfer_cookies(ctx_cookies)
-        tree, response = ToolBox.handle_html(ctx_url, cookie)
-        dlc_tag = tree.xpath(
-            "//li[@data-component='PDPTertiaryNavigation']//a[contains(@href,'dlc')]"
-        )
-        if not dlc_tag:
-            return []
+        tree, response = ToolBox.handle_html(ctx_url, cookie, scraper=scraper)
+        # 被拦截的商品页同样没有附加内容入口，仅缓存完整的商品页
+        cacheable = response.status_code == 200 and bool(xpaths.PURCHASE_MESSAGE(tree))
+        dlc_page = self.parse_dlc_page(tree)
+        if not dlc_page:
+            return [], cacheable
 
         # [🚀] 检测当前商品是否有免费的DLC
-        dlc_page = (
-            f"{self.URL_MASTER_HOST}{dlc_tag[0].attrib.get('href')}?"
+        dlc_tree, response = ToolBox.handle_html(dlc_page, cookie, scraper=scraper)
+        cacheable = (
+            cacheable
+            and response.status_code < 400
+            and bool(xpaths.DLC_NOT_FOUND(dlc_tree) or xpaths.DLC_CARDS(dlc_tree))
+        )
+        dlc_details = self.parse_free_dlc_details(
+            dlc_tree, response.url, response.status_code
+        )
+        return dlc_details, cacheable
+
+    @staticmethod
+    def parse_dlc_page(tree) -> Optional[str]:
+        """
+        解析商品页的附加内容入口
+
+        :param tree: 商品页 etree.HTML
+        :return: 筛选免费附加内容的列表页链接，不存在附加内容时返回 None
+        """
+        dlc_tag = xpaths.DLC_ENTRY(tree)
+        if not dlc_tag:
+            return None
+        return (
+            f"{GameClaimer.URL_MASTER_HOST}{dlc_tag[0].attrib.get('href')}?"
             f"sortBy=relevancy&sortDir=DESC&priceTier=tierFree&count=40&start=0"
         )
-        dlc_tree, response = ToolBox.handle_html(dlc_page, cookie)
-        if dlc_tree.xpath("//span[text()='未找到结果']"):
+
+    @staticmethod
+    def parse_free_dlc_details(
+        dlc_tree, response_url: str, status_code: int = 200
+    ) -> List[Dict[str, Union[str, bool]]]:
+        """
+        解析附加内容列表页中的免费附加内容
+
+        :param dlc_tree: 附加内容列表页 etree.HTML
+        :param response_url: 列表页最终的响应链接，用于识别重定向
+        :param status_code: 列表页响应状态码
+        :return: [{"url": url of dlc, "name": name of dlc, "dlc": True}, ... ]
+        """
+        if xpaths.DLC_NOT_FOUND(dlc_tree):
             return []
 
         # [🚀] 获取当前商品所有免费DLC链接
-        dlc_tags: list = dlc_tree.xpath("//div[@data-component='DiscoverCard']//a")
+        dlc_tags: list = xpaths.DLC_CARDS(dlc_tree)
         dlc_details = {}
         for tag in dlc_tags:
             # [📝] 获取 DLC 名称
@@ -74,14 +183,14 @@ class GameClaimer(EpicAwesomeGamer):
             try:
                 name = aria_label.split(",")[0]
             except (IndexError, AttributeError):
-                name = response.url.split("/")[-1]
+                name = response_url.split("/")[-1]
 
             # 部分地区账号会被重定向至附加内容的默认页面
             # 此页面未触发筛选器，混杂着付费/免费的附加内容
             is_free = True
             try:
                 # 重新判断当前游戏的状态，清洗付费游戏
-                if "tierFree" not in response.url or response.status_code == 302:
+                if "tierFree" not in response_url or status_code == 302:
                     is_free = aria_label.split(",")[-1].strip() == "0"
             # 当出现意外的标签时将此实例视为免费游戏送入任务队列
             # 下层驱动中有更加明确的游戏状态用以剔除杂质
@@ -90,7 +199,7 @@ class GameClaimer(EpicAwesomeGamer):
 
             # 编织缓存
             if is_free:
-                url = f"{self.URL_MASTER_HOST}{tag.attrib.get('href')}"
+                url = f"{GameClaimer.URL_MASTER_HOST}{tag.attrib.get('href')}"
                 dlc_detail = {"url": url, "name": name, "dlc": True}
                 dlc_details.update({url: dlc_detail})
 
@@ -102,8 +211,7 @@ class GameClaimer(EpicAwesomeGamer):
         cookie = ToolBox.transfer_cookies(ctx_cookies)
         tree, response = ToolBox.handle_html(self.URL_GAME_CART, cookie)
 
-        assert_obj = tree.xpath("//span[text()='您的购物车是空的。']")
-        if len(assert_obj) != 0:
+        if self.parse_empty_cart(tree):
             if init:
                 logger.debug(
                     ToolBox.runtime_report(
@@ -119,6 +227,11 @@ class GameClaimer(EpicAwesomeGamer):
             return True
         return False
 
+    @staticmethod
+    def parse_empty_cart(tree) -> bool:
+        """解析购物车页面是否为空"""
+        return len(xpaths.CART_EMPTY(tree)) != 0
+
     def cart_balancing(self, ctx_cookies: List[dict], ctx_session, init=True):
         """
         购物车|愿望清单的内容转移
@@ -258,6 +371,7 @@ class GameClaimer(EpicAwesomeGamer):
 
         return self.result
 
+    @traced("claim_attempt")
     def claim_stabilizer(
         self, page_link: str, ctx_cookies: List[dict], ctx_session
     ) -> Optional[str]:
@@ -4,17 +4,18 @@
 # Github     : https://github.com/QIN2DIM
 # Description:
 import time
+from io import BytesIO
 from typing import List, Optional, Dict, Union
 
-from bs4 import BeautifulSoup
-from cloudscraper import create_scraper
+from lxml import etree
 
 from services.settings import logger
-from services.utils import ToolBox
-from .core import CookieManager, EpicAwesomeGamer
+from services.utils import ToolBox, get_session, traced, rebase_urls
+from .core import CookieManager, EpicAwesomeGamer, AssertUtils
 from .exceptions import AuthException, AssertTimeout, CookieExpired
 
 
+@rebase_urls
 class UnrealClaimer(EpicAwesomeGamer):
     """虚幻商城月供砖家"""
 
@@ -40,13 +41,10 @@ class UnrealClaimer(EpicAwesomeGamer):
     ) -> List[Dict[str, Union[str, bool]]]:
         """领取任务后审查资源的在库状态"""
         headers = {"cookie": ToolBox.transfer_cookies(ctx_cookies)}
-        scraper = create_scraper()
-        response = scraper.get(self.URL_FREE_FOR_THE_MONTH, headers=headers)
-        soup = BeautifulSoup(response.text, "html.parser")
+        response = get_session().get(self.URL_FREE_FOR_THE_MONTH, headers=headers)
+        details = self.parse_claimer_response(response.content)
 
-        try:
-            articles = soup.find("div", class_="asset-list-group").find_all("article")
-        except AttributeError:
+        if details is None:
             logger.critical(
                 ToolBox.runtime_report(
                     motive="CRASH",
@@ -56,27 +54,63 @@ class UnrealClaimer(EpicAwesomeGamer):
                 )
             )
             return []
-        else:
-            if not articles:
-                logger.critical(
-                    ToolBox.runtime_report(
-                        motive="MISS",
-                        action_name=self.action_name,
-                        message="虚幻商店月供内容或为空，请复查",
-                    )
+        if not details:
+            logger.critical(
+                ToolBox.runtime_report(
+                    motive="MISS",
+                    action_name=self.action_name,
+                    message="虚幻商店月供内容或为空，请复查",
                 )
-                return []
-            details = [
-                {
-                    "name": article.find("h3").text,
-                    "status": self.assert_.GAME_OK
-                    if "撰写评论" in article.text
-                    else self.assert_.GAME_PENDING,
-                }
-                for article in articles
-            ]
-
-            return details
+            )
+        return details
+
+    @staticmethod
+    def parse_claimer_response(
+        html: Union[str, bytes]
+    ) -> Optional[List[Dict[str, str]]]:
+        """
+        解析虚幻商城月供内容页的资源在库状态
+
+        流式解析页面，只保留 asset-list-group 子树，读取完毕后不再解析剩余的页面。
+        :param html: 月供内容页源码
+        :return: [{"name": 资源名, "status": 在库状态}, ...] 页面元素改变时返回 None
+        """
+        if isinstance(html, str):
+            html = html.encode("utf8")
+
+        details, group = [], None
+        for event, element in etree.iterparse(
+            BytesIO(html), events=("start", "end"), html=True, encoding="utf8"
+        ):
+            # 定位资源列表 丢弃列表之前已解析完毕的节点
+            if group is None:
+                if event == "start" and element.tag == "div":
+                    if "asset-list-group" in (element.get("class") or "").split():
+                        group = element
+                elif event == "end":
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+                continue
+            if event != "end":
+                continue
+            if element.tag == "article":
+                name = element.find(".//h3")
+                if name is None:
+                    return None
+                details.append(
+                    {
+                        "name": "".join(name.itertext()),
+                        "status": AssertUtils.GAME_OK
+                        if "撰写评论" in "".join(element.itertext())
+                        else AssertUtils.GAME_PENDING,
+                    }
+                )
+                element.clear()
+            elif element is group:
+                break
+
+        return None if group is None else details
 
     def get_free_content(self, ctx, ctx_cookies):
         """获取虚幻商城的本月免费内容"""
@@ -111,6 +145,7 @@ class UnrealClaimer(EpicAwesomeGamer):
             init = False
             self.assert_.timeout(_loop_start, self.loop_timeout)
 
+    @traced("claim_attempt")
     def claim_stabilizer(self, ctx_cookies: List[dict], ctx_session):
         try:
             self.get_free_content(ctx=ctx_session, ctx_cookies=ctx_cookies)
@@ -4,20 +4,41 @@
 # Github     : https://github.com/QIN2DIM
 # Description:
 import random
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Union
+from typing import Optional, List, Dict, Union, Callable
 
-import apprise
 import pytz
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from gevent.queue import Queue
 
 from services.bricklayer import GameClaimer
 from services.bricklayer import UnrealClaimer
 from services.explorer import Explorer
-from services.settings import logger, MESSAGE_PUSHER_SETTINGS, PLAYER
-from services.utils import ToolBox, get_challenge_ctx
+from services.settings import (
+    logger,
+    MESSAGE_PUSHER_SETTINGS,
+    PLAYER,
+    DIR_LOG,
+    PATH_NOTIFY_OUTBOX,
+)
+from services.utils import (
+    ToolBox,
+    get_challenge_ctx,
+    get_session,
+    close_session,
+    close_ctx_pool,
+    get_tracer,
+    span,
+    traced,
+    MessageNotifier,
+)
+
+# 进程内共用的消息推送器 在调度器的多次运行之间复用推送渠道
+notifier = MessageNotifier(path_outbox=PATH_NOTIFY_OUTBOX)
 
 
 class ClaimerScheduler:
@@ -33,15 +54,21 @@ class ClaimerScheduler:
         self.scheduler = BlockingScheduler()
         self.logger = logger
 
-    def deploy_on_vps(self):
-        """部署最佳实践的 VPS 定时任务"""
+    def _deploy_cron_job(self, func: Optional[Callable] = None):
+        """
+        北京时间每周五凌晨 4 点的定时任务
+
+        :param func: 任务函数，缺省为 job_loop_claim。自适应调度的回退任务需传入
+            job_adaptive_claim，以便在每次运行后重新根据促销数据调度。
+        :return:
+        """
 
         # [⏰] 北京时间每周五凌晨 4 点的 两个任意时刻 执行任务
         jitter_minute = [random.randint(10, 20), random.randint(35, 57)]
 
         # [⚔] 首发任务用于主动认领，备用方案用于非轮询审核
         self.scheduler.add_job(
-            func=self.job_loop_claim,
+            func=func or self.job_loop_claim,
             trigger=CronTrigger(
                 day_of_week="fri",
                 hour="4",
@@ -53,7 +80,9 @@ class ClaimerScheduler:
                 # 必须使用 `jitter` 弥散任务发起时间
                 jitter=15,
             ),
+            id="loop_claim",
             name="loop_claim",
+            replace_existing=True,
         )
 
         self.logger.debug(
@@ -66,6 +95,70 @@ class ClaimerScheduler:
             )
         )
 
+    def _next_promotion_boundary(self) -> Optional[datetime]:
+        """根据促销数据计算下一个周免活动的边界时刻"""
+        explorer = Explorer(silence=self.silence)
+        try:
+            explorer.get_promotions(ctx_cookies=[])
+        except Exception as err:  # noqa
+            self.logger.exception(err)
+            return None
+
+        now = datetime.now(pytz.utc)
+        for boundary in explorer.promotion_boundaries:
+            try:
+                run_date = datetime.fromisoformat(boundary.replace("Z", "+00:00"))
+            except ValueError:
+                continue
+            if now < run_date < self.end_date:
+                return run_date
+        return None
+
+    def _deploy_adaptive_job(self) -> bool:
+        """
+        在下一个周免活动的边界时刻之后执行任务
+
+        :return: 促销数据缺失时返回 False
+        """
+        run_date = self._next_promotion_boundary()
+        if run_date is None:
+            return False
+
+        # [⏰] 商城刷新促销数据存在延迟，在边界时刻之后的任意时刻执行任务
+        run_date += timedelta(minutes=random.randint(10, 30))
+        self.scheduler.add_job(
+            func=self.job_adaptive_claim,
+            trigger=DateTrigger(run_date=run_date),
+            id="adaptive_claim",
+            name="adaptive_claim",
+            replace_existing=True,
+        )
+        # 促销数据恢复后撤下回退的定时任务
+        if self.scheduler.get_job("loop_claim"):
+            self.scheduler.remove_job("loop_claim")
+
+        self.logger.debug(
+            ToolBox.runtime_report(
+                motive="JOB",
+                action_name=self.action_name,
+                message="任务将在下一个周免活动开始后执行。",
+                run_date=str(run_date.astimezone(pytz.timezone("Asia/Shanghai"))),
+            )
+        )
+        return True
+
+    def deploy_on_vps(self, adaptive: Optional[bool] = False):
+        """
+        部署最佳实践的 VPS 定时任务
+
+        :param adaptive: 根据促销数据中的活动起止时刻调度任务，数据缺失时回退至每周五的定时任务。
+        :return:
+        """
+        if not adaptive or self.unreal:
+            self._deploy_cron_job()
+        elif not self._deploy_adaptive_job():
+            self._deploy_cron_job(func=self.job_adaptive_claim)
+
         # [⚔] Gracefully run scheduler.`
         try:
             self.scheduler.start()
@@ -79,11 +172,14 @@ class ClaimerScheduler:
                 )
             )
 
-    def deploy_jobs(self, platform: Optional[str] = None):
+    def deploy_jobs(
+        self, platform: Optional[str] = None, adaptive: Optional[bool] = False
+    ):
         """
         部署系统任务
 
         :param platform: within [vps serverless qing-long]
+        :param adaptive: 根据周免活动的起止时刻调度任务，仅作用于 vps
         :return:
         """
         platform = "vps" if platform is None else platform
@@ -101,7 +197,7 @@ class ClaimerScheduler:
 
         # [⚔] Distribute common state machine patterns
         if platform == "vps":
-            self.deploy_on_vps()
+            self.deploy_on_vps(adaptive=adaptive)
         elif platform == "serverless":
             raise NotImplementedError
         elif platform == "qing-long":
@@ -116,36 +212,67 @@ class ClaimerScheduler:
             with UnrealClaimerInstance(silence=self.silence) as claimer:
                 claimer.just_do_it()
 
+    def job_adaptive_claim(self):
+        """
+        认领周免游戏后调度下一个周免活动的任务
+
+        促销数据缺失时回退至每周五的定时任务，回退任务在每次运行后同样尝试重新调度。
+        """
+        try:
+            self.job_loop_claim()
+        finally:
+            if not self._deploy_adaptive_job():
+                self._deploy_cron_job(func=self.job_adaptive_claim)
+
 
 class ClaimerInstance:
     """单步子任务 认领周免游戏"""
 
-    def __init__(self, silence: bool, log_ignore: Optional[bool] = False):
+    def __init__(
+        self,
+        silence: bool,
+        log_ignore: Optional[bool] = False,
+        power: Optional[int] = None,
+    ):
         """
 
         :param silence:
         :param log_ignore: 过滤掉已在库的资源实体的推送信息。
+        :param power: 在库判断的最大并发数
         """
         self.action_name = "ClaimerInstance"
+        # 认领轮次
         self.depth = 0
+        self.max_rounds = 2
         self.silence = silence
         self.logger = logger
         self.log_ignore = log_ignore
+        self.power = 4 if power is None else max(1, power)
+        # 运行耗时报告 与 runtime.log 同目录
+        self.path_timing = join(DIR_LOG, "timing.jsonl")
+        self.tracer = get_tracer()
+        self.tracer.reset(name=self.__class__.__name__)
 
         # 服务注册
         self.bricklayer = GameClaimer(silence=silence)
         self.explorer = Explorer(silence=silence)
         # 尚未初始化的挑战者上下文容器
         self._ctx_session = None
+        # 在库判断共用的会话
+        self._scraper = get_session()
         # 任务队列 按顺缓存周免游戏及其免费附加内容的认领任务
         self.task_queue_pending = Queue()
-        self.task_queue_worker = Queue()
         # 消息队列 按序缓存认领任务的执行状态
         self.message_queue = Queue()
         # 内联数据容器 编排推送模版
         self.inline_docker = []
 
     def __enter__(self):
+        # 后台重新投递上一次运行中推送失败的消息
+        if MESSAGE_PUSHER_SETTINGS["enable"]:
+            notifier.register(MESSAGE_PUSHER_SETTINGS["pusher"])
+            notifier.retry_outbox()
+
         if self.bricklayer.cookie_manager.refresh_ctx_cookies(
                 keep_live=True, silence=self.silence
         ):
@@ -154,8 +281,9 @@ class ClaimerInstance:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # 消息推送
-        self._pusher_wrapper()
+        # 消息推送 编排消息并交由后台发送
+        with span("pusher"):
+            self._pusher_wrapper()
 
         # 缓存卸载
         try:
@@ -163,6 +291,39 @@ class ClaimerInstance:
                 self._ctx_session.quit()
         except AttributeError:
             pass
+        finally:
+            close_ctx_pool()
+            close_session()
+            # 释放浏览器后再等待推送结果，未送达的消息留在发件箱
+            with span("notify_flush"):
+                notifier.flush()
+            self._dump_timing()
+
+    def _dump_timing(self):
+        try:
+            report = self.tracer.dump(self.path_timing)
+        except OSError as err:
+            self.logger.warning(
+                ToolBox.runtime_report(
+                    motive="TIMING",
+                    action_name=self.action_name,
+                    message="耗时报告写入失败",
+                    err=err,
+                )
+            )
+            return
+        self.logger.debug(
+            ToolBox.runtime_report(
+                motive="TIMING",
+                action_name=self.action_name,
+                message="⏱ 运行耗时报告",
+                elapsed=f"{report['elapsed']}s",
+                stages=" ".join(
+                    f"{stage}:{stats['total']}s"
+                    for stage, stats in report["stages"].items()
+                ),
+            )
+        )
 
     def _pusher_putter(self, result: str, obj: Dict[str, Union[bool, str]]):
         _runtime = {"status": result, "name": obj["name"], "dlc": obj.get("dlc", False)}
@@ -232,21 +393,20 @@ class ClaimerInstance:
             f"Total: {inline_docker.__len__()}",
         ]
 
-        # 注册 Apprise 消息推送框架
-        active_pusher = pusher_settings["pusher"]
-        surprise = apprise.Apprise()
-        for server in active_pusher.values():
-            surprise.add(server)
+        # 注册推送渠道 沿用已有的 Apprise 实例
+        active_pusher = notifier.register(pusher_settings["pusher"])
 
-        # 发送模版消息
-        surprise.notify(body="\n".join(_inline_textbox), title="EpicAwesomeGamer 运行报告")
+        # 投递模版消息 由后台线程并行发送
+        notifier.submit(
+            body="\n".join(_inline_textbox), title="EpicAwesomeGamer 运行报告"
+        )
 
-        self.logger.success(
+        self.logger.debug(
             ToolBox.runtime_report(
                 motive="Notify",
                 action_name=self.action_name,
-                message="消息推送完毕",
-                active_pusher=[i[0] for i in active_pusher.items() if i[-1]],
+                message="消息已加入推送队列",
+                active_pusher=active_pusher,
             )
         )
 
@@ -260,6 +420,7 @@ class ClaimerInstance:
                 ctx_session=self._ctx_session
             )
 
+    @traced("promotions_filter")
     def promotions_filter(self):
         """
         促销实体过滤器
@@ -273,7 +434,9 @@ class ClaimerInstance:
 
         def in_library(page_link: str, name: str) -> bool:
             response = self.explorer.game_manager.is_my_game(
-                ctx_cookies=self._ctx_cookies, page_link=page_link
+                ctx_cookies=self._ctx_cookies,
+                page_link=page_link,
+                scraper=self._scraper,
             )
             # 资源待认领
             if not response["status"] and response["assert"] != "AssertObjectNotFound":
@@ -296,26 +459,131 @@ class ClaimerInstance:
             )
             return True
 
+        def get_dlc_details(page_link: str) -> List[Dict[str, Union[str, bool]]]:
+            return self.bricklayer.get_free_dlc_details(
+                ctx_url=page_link,
+                ctx_cookies=self._ctx_cookies,
+                scraper=self._scraper,
+                deadline=self.explorer.promotion_deadlines.get(page_link),
+            )
+
         promotions = self.get_promotions()
         if not isinstance(promotions, dict) or not promotions["urls"]:
             return promotions
 
         # 过滤资源实体
-        for url in promotions["urls"]:
-            # 标记已在库游戏本体
-            job_name = promotions[url]
-            self.task_queue_pending.put(
-                {"url": url, "name": job_name, "in_library": in_library(url, job_name)}
+        # 所有的在库判断共用同一个会话并发执行，按促销顺序回填任务队列
+        urls = promotions["urls"]
+        with ThreadPoolExecutor(max_workers=self.power) as executor:
+            # 标记已在库游戏本体 识别免费附加内容
+            game_checks = [
+                executor.submit(in_library, url, promotions[url]) for url in urls
+            ]
+            dlc_searches = [executor.submit(get_dlc_details, url) for url in urls]
+
+            # 标记已在库的免费附加内容
+            dlc_checks = [
+                [
+                    (dlc, executor.submit(in_library, dlc["url"], dlc["name"]))
+                    for dlc in dlc_search.result()
+                ]
+                for dlc_search in dlc_searches
+            ]
+
+            for url, game_check, dlc_check in zip(urls, game_checks, dlc_checks):
+                game_obj = {"url": url, "name": promotions[url]}
+                game_obj.update({"in_library": game_check.result()})
+                self.task_queue_pending.put(game_obj)
+                for dlc, future in dlc_check:
+                    dlc.update({"in_library": future.result()})
+                    self.task_queue_pending.put(dlc)
+
+    def claim(self, jobs: List[Dict[str, Union[str, bool]]]):
+        """
+        认领待领取的资源实体
+
+        :param jobs: 待认领的资源实体
+        :return: 需要复查在库状态的资源实体
+        """
+        if self._ctx_session is None:
+            self._ctx_session = get_challenge_ctx(self.silence)
+
+        # 自动选择效益最高的优化方案
+        if len(jobs) == 1:
+            self.bricklayer.claim_mode = self.bricklayer.CLAIM_MODE_GET
+            job = jobs[0]
+            job["result"] = self.bricklayer.claim_stabilizer(
+                page_link=job["url"],
+                ctx_cookies=self._ctx_cookies,
+                ctx_session=self._ctx_session,
             )
-            # 识别免费附加内容
-            dlc_details = self.bricklayer.get_free_dlc_details(
-                ctx_url=url, ctx_cookies=self._ctx_cookies
+            # 领取结果已在订单页确认 无需复查
+            if job["result"] in [
+                self.bricklayer.assert_.GAME_CLAIM,
+                self.bricklayer.assert_.GAME_OK,
+            ]:
+                self.explorer.game_manager.ledger.record(job["url"], job["result"])
+                self._pusher_putter(result=job["result"], obj=job)
+                return []
+            return jobs
+
+        self.bricklayer.claim_mode = self.bricklayer.CLAIM_MODE_ADD
+        self.bricklayer.cart_balancing(
+            ctx_cookies=self._ctx_cookies, ctx_session=self._ctx_session
+        )
+        for job in jobs:
+            self.bricklayer.claim_stabilizer(
+                page_link=job["url"],
+                ctx_cookies=self._ctx_cookies,
+                ctx_session=self._ctx_session,
             )
-            # 标记已在库的免费附加内容
-            for dlc in dlc_details:
-                dlc.update({"in_library": in_library(dlc["url"], dlc["name"])})
-                self.task_queue_pending.put(dlc)
+        self.bricklayer.empty_shopping_payment(
+            ctx_cookies=self._ctx_cookies, ctx_session=self._ctx_session
+        )
+        return jobs
 
+    @traced("verify")
+    def verify(self, jobs: List[Dict[str, Union[str, bool]]]):
+        """
+        复查已尝试认领的资源实体
+
+        :param jobs: 已尝试认领的资源实体
+        :return: 仍未在库的资源实体
+        """
+
+        def is_owned(job: Dict[str, Union[str, bool]]) -> bool:
+            response = self.explorer.game_manager.is_my_game(
+                ctx_cookies=self._ctx_cookies,
+                page_link=job["url"],
+                scraper=self._scraper,
+            )
+            return response["status"] is True
+
+        with ThreadPoolExecutor(max_workers=self.power) as executor:
+            owned = list(executor.map(is_owned, jobs))
+
+        pending = []
+        for job, is_owned_ in zip(jobs, owned):
+            if is_owned_:
+                self._pusher_putter(result=self.bricklayer.assert_.GAME_CLAIM, obj=job)
+            else:
+                pending.append(job)
+        return pending
+
+    def _collect_pending(self) -> List[Dict[str, Union[str, bool]]]:
+        """推送已在库的资源实体，返回待认领的资源实体"""
+        pending = []
+        while not self.task_queue_pending.empty():
+            obj = self.task_queue_pending.get()
+            self.tracer.incr("promotions")
+            if obj["in_library"]:
+                self.tracer.incr("in_library")
+                self._pusher_putter(result=self.bricklayer.assert_.GAME_OK, obj=obj)
+            else:
+                pending.append(obj)
+        return pending
+
+    @traced("just_do_it")
     def just_do_it(self):
         """认领周免游戏及其免费附加内容"""
         # ======================================
@@ -325,65 +593,39 @@ class ClaimerInstance:
         # 2. 剔除资源<已在库中>
         # ======================================
         self.promotions_filter()
-
-        while not self.task_queue_pending.empty():
-            game_obj = self.task_queue_pending.get()
-            if game_obj["in_library"]:
-                result = self.bricklayer.assert_.GAME_OK
-                self._pusher_putter(result=result, obj=game_obj)
-            else:
-                self.task_queue_worker.put(game_obj)
+        pending = self._collect_pending()
 
         # ======================================
         # [🚀] 前有重要道具！但是人机挑战……
         # ======================================
-        # 1. 启动消息队列 编排消息模版
-        # 2. 启动任务队列 领取周免游戏
+        # 1. 认领待领取的资源实体
+        # 2. 仅复查本轮尝试认领的资源实体，未在库的资源进入下一轮
         # ======================================
-        if self.task_queue_worker.empty() or self.depth >= 2:
-            return
-        if self._ctx_session is None:
-            self._ctx_session = get_challenge_ctx(self.silence)
+        while pending and self.depth < self.max_rounds:
+            self.depth += 1
+            attempted = self.claim(pending)
+            pending = self.verify(attempted) if attempted else []
 
-        # 自动选择效益最高的优化方案
-        if self.task_queue_worker.qsize() == 1:
-            self.bricklayer.claim_mode = self.bricklayer.CLAIM_MODE_GET
-            job = self.task_queue_worker.get()
-            result = self.bricklayer.claim_stabilizer(
-                page_link=job["url"],
-                ctx_cookies=self._ctx_cookies,
-                ctx_session=self._ctx_session,
-            )
+        # 多轮认领后仍未在库的资源实体
+        for job in pending:
+            result = job.get("result") or self.bricklayer.assert_.GAME_PENDING
             self._pusher_putter(result=result, obj=job)
-        else:
-            self.bricklayer.claim_mode = self.bricklayer.CLAIM_MODE_ADD
-            self.bricklayer.cart_balancing(
-                ctx_cookies=self._ctx_cookies, ctx_session=self._ctx_session
-            )
-            while not self.task_queue_worker.empty():
-                card = self.task_queue_worker.get()
-                self.bricklayer.claim_stabilizer(
-                    page_link=card["url"],
-                    ctx_cookies=self._ctx_cookies,
-                    ctx_session=self._ctx_session,
-                )
-            self.bricklayer.empty_shopping_payment(
-                ctx_cookies=self._ctx_cookies, ctx_session=self._ctx_session
-            )
-
-            # [🛵] 接下来，跳跃很有用
-            self.depth += 1
-            return self.just_do_it()
 
 
 class UnrealClaimerInstance(ClaimerInstance):
     """虚幻商城月供砖家"""
 
-    def __init__(self, silence: bool, log_ignore: Optional[bool] = False):
-        super().__init__(silence=silence, log_ignore=log_ignore)
+    def __init__(
+        self,
+        silence: bool,
+        log_ignore: Optional[bool] = False,
+        power: Optional[int] = None,
+    ):
+        super().__init__(silence=silence, log_ignore=log_ignore, power=power)
 
         self.bricklayer = UnrealClaimer(silence=silence)
 
+    @traced("promotions_filter")
     def promotions_filter(self):
         def in_library(name: str, status: str) -> bool:
             # 资源待认领
@@ -414,37 +656,25 @@ class UnrealClaimerInstance(ClaimerInstance):
             )
             self.task_queue_pending.put(content_obj)
 
-    def just_do_it(self):
-        """虚幻商城月供砖家"""
-        # ======================================
-        # [🚀] 你以为是武器吧？但是居然是讯息……
-        # ======================================
-        # 1. 获取资源<本周免费>
-        # 2. 剔除资源<已在库中>
-        # ======================================
-        self.promotions_filter()
-
-        while not self.task_queue_pending.empty():
-            content_obj = self.task_queue_pending.get()
-            if content_obj["in_library"]:
-                self._pusher_putter(result=content_obj["status"], obj=content_obj)
-            else:
-                self.task_queue_worker.put(content_obj)
-
-        # ======================================
-        # [🚀] 前有重要道具！但是人机挑战……
-        # ======================================
-        # 1. 启动消息队列 编排消息模版
-        # 2. 启动任务队列 领取周免游戏
-        # ======================================
-        if self.task_queue_worker.empty() or self.depth >= 2:
-            return
+    def claim(self, jobs: List[Dict[str, Union[str, bool]]]):
+        """月供内容在同一页面中批量认领"""
         if self._ctx_session is None:
             self._ctx_session = get_challenge_ctx(self.silence)
         self.bricklayer.claim_stabilizer(
             ctx_session=self._ctx_session, ctx_cookies=self._ctx_cookies
         )
+        return jobs
 
-        # [🛵] 接下来，跳跃很有用
-        self.depth += 1
-        return self.just_do_it()
+    @traced("verify")
+    def verify(self, jobs: List[Dict[str, Union[str, bool]]]):
+        """月供内容页一次返回所有资源的在库状态，仅比对已尝试认领的资源"""
+        content_objs = self.bricklayer.get_claimer_response(self._ctx_cookies)
+        status = {obj["name"]: obj["status"] for obj in content_objs}
+
+        pending = []
+        for job in jobs:
+            if status.get(job["name"]) == self.bricklayer.assert_.GAME_OK:
+                self._pusher_putter(result=self.bricklayer.assert_.GAME_CLAIM, obj=job)
+            else:
+                pending.append(job)
+        return pending
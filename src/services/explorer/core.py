@@ -3,9 +3,12 @@
 # Author     : QIN2DIM
 # Github     : https://github.com/QIN2DIM
 # Description:
+import copy
+import json
 import os.path
 import time
-from typing import ContextManager
+from typing import ContextManager, Tuple, Iterator
+from urllib.parse import urljoin
 
 # -*- coding: utf-8 -*-
 # Time       : 2022/1/17 15:20
@@ -14,7 +17,6 @@ from typing import ContextManager
 # Description:
 from typing import List, Optional, Union, Dict
 
-import cloudscraper
 import yaml
 from lxml import etree
 from selenium.common.exceptions import WebDriverException, InvalidCookieDomainException
@@ -25,12 +27,18 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 
-from services.settings import DIR_EXPLORER
+from services.settings import DIR_EXPLORER, PATH_CLAIM_LEDGER, EPIC_EMAIL
 from services.settings import logger
-from services.utils import ToolBox
-from .exceptions import DiscoveryTimeoutException
+from services.utils import ToolBox, get_session, rebase_urls, xpaths
+from .exceptions import DiscoveryTimeoutException, DiscoveryParseException
+from .ledger import ClaimLedger
 
+# 优先使用 LibYAML 加速商城缓存的读写
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
 
+
+@rebase_urls
 class EpicAwesomeExplorer:
     """游戏商店探索者 获取免费游戏数据以及促销信息"""
 
@@ -54,6 +62,7 @@ class EpicAwesomeExplorer:
         # 运行缓存
         self.runtime_workspace = None
         self.path_free_games = "ctx_store.yaml"
+        self.path_promotions = "promotions.json"
         self.game_objs = {}  # {index0:{name:value url:value}, }
         self.category_details = {
             "game": {"url": self.URL_STORE_FREE_GAME, "flag": "免费游戏"},
@@ -67,6 +76,118 @@ class EpicAwesomeExplorer:
         """初始化工作目录 缓存游戏商店数据"""
         self.runtime_workspace = "." if not os.path.exists(DIR_EXPLORER) else DIR_EXPLORER
         self.path_free_games = os.path.join(self.runtime_workspace, self.path_free_games)
+        self.path_promotions = os.path.join(self.runtime_workspace, self.path_promotions)
+
+    def _update_game_objs(self, name: str, url: str) -> None:
+        self.game_objs.update(
+            {
+                self.game_objs.__len__(): {
+                    "name": name.split(",")[0].replace("\n", "").strip(),
+                    "url": url.strip(),
+                }
+            }
+        )
+
+    @staticmethod
+    def parse_free_games(
+        tree, page_url: str
+    ) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        解析免费商城的列表页
+
+        :param tree: etree.HTML(response.content)
+        :param page_url: 列表页的实际链接，用于补全相对链接
+        :return: ([{"name": aria-label, "url": href}, ...], 最后一个翻页按钮的链接)
+        """
+        if tree is None:
+            return [], None
+
+        game_objs = [
+            {"name": a.get("aria-label"), "url": urljoin(page_url, a.get("href"))}
+            for a in xpaths.FREE_GAME_CARDS(tree)
+            if a.get("aria-label") and a.get("href")
+        ]
+        page_switcher = xpaths.PAGINATION_HREFS(tree)
+        page_end = urljoin(page_url, page_switcher[-1]) if page_switcher else None
+
+        return game_objs, page_end
+
+    def _discovery_free_games_by_http(
+        self, ctx_cookies: Optional[List[dict]], category: str = "game"
+    ) -> None:
+        """
+        不启动浏览器，直接解析免费商城的列表页
+
+        :param ctx_cookies:
+        :param category:
+        :return:
+        """
+        for _ in self._iter_free_games_by_http(ctx_cookies, category=category):
+            pass
+
+    def _iter_free_games_by_http(
+        self, ctx_cookies: Optional[List[dict]], category: str = "game"
+    ) -> Iterator[List[Dict[str, str]]]:
+        """
+        逐页解析免费商城的列表页
+
+        :param ctx_cookies:
+        :param category:
+        :return: 每解析一页产出该页的 [{"name": str, "url": str}, ...]
+        """
+        url = self.category_details[category]["url"]
+        flag = self.category_details[category]["flag"]
+        cookie = ToolBox.transfer_cookies(ctx_cookies) if ctx_cookies else None
+
+        _mode = "（深度搜索）" if ctx_cookies else "（广度搜索）"
+        logger.debug(
+            ToolBox.runtime_report(
+                motive="DISCOVERY",
+                action_name=self.action_name,
+                message=f"📡 正在为玩家搜集{flag}{_mode}...",
+                mode="http",
+            )
+        )
+
+        _url_store_free = url
+        _visited = set()
+        while _url_store_free not in _visited:
+            _visited.add(_url_store_free)
+            tree, response = ToolBox.handle_html(
+                _url_store_free, cookie, allow_redirects=True
+            )
+
+            # 判断异常跳转
+            if "tierFree" not in response.url:
+                break
+
+            # 提取价值信息
+            game_objs, page_end = self.parse_free_games(tree, response.url)
+            if not game_objs:
+                # 首页为空说明页面结构改变或内容由前端渲染，交由浏览器处理
+                if not self.game_objs:
+                    raise DiscoveryParseException(f"未能从列表页解析{flag}链接")
+                break
+            for game_obj in game_objs:
+                self._update_game_objs(name=game_obj["name"], url=game_obj["url"])
+            yield game_objs
+
+            # 页面跳转判断
+            if not page_end or page_end in response.url:
+                break
+
+            # 更新跳转链接
+            _url_store_free = page_end
+
+        logger.success(
+            ToolBox.runtime_report(
+                motive="DISCOVERY",
+                action_name=self.action_name,
+                message=f"{flag}搜集完毕",
+                qsize=len(self.game_objs),
+                mode="http",
+            )
+        )
 
     def _discovery_free_games(
         self,
@@ -132,15 +253,9 @@ class EpicAwesomeExplorer:
             # 提取价值信息
             game_objs = ctx.find_elements(By.XPATH, "//a[@class='css-1jx3eyg']")
             for game_obj in game_objs:
-                name = game_obj.get_attribute("aria-label")
-                url = game_obj.get_attribute("href")
-                self.game_objs.update(
-                    {
-                        self.game_objs.__len__(): {
-                            "name": name.split(",")[0].replace("\n", "").strip(),
-                            "url": url.strip(),
-                        }
-                    }
+                self._update_game_objs(
+                    name=game_obj.get_attribute("aria-label"),
+                    url=game_obj.get_attribute("href"),
                 )
 
             # 页面跳转判断
@@ -215,29 +330,168 @@ class EpicAwesomeExplorer:
 
         return pending_games
 
+    @staticmethod
+    def parse_stress_expressions(tree, page_url: str) -> Dict[str, str]:
+        """
+        应力表达式的静态实现 解析服务端渲染的商城首页
+
+        :param tree: etree.HTML(response.content)
+        :param page_url: 首页的实际链接，用于补全相对链接
+        :return: {url: title}
+        """
+        pending_games = {}
+        if tree is None:
+            return pending_games
+
+        for anchor in xpaths.FREE_NOW_CARDS(tree):
+            if not anchor.get("href"):
+                continue
+            title = xpaths.OFFER_TITLE(anchor)
+            url = urljoin(page_url, anchor.get("href"))
+            pending_games[url] = xpaths.STRING(title[0]).strip() if title else "null"
+
+        return pending_games
+
+    @staticmethod
+    def parse_embedded_promotions(tree) -> Dict[str, str]:
+        """
+        解析商城页面内嵌的状态数据 `window.__REACT_QUERY_INITIAL_QUERIES__`
+
+        页面由前端渲染时卡片不在 HTML 中，但促销数据仍随首屏下发。
+        仅保留正在进行且折扣后免费的促销。
+        :param tree: etree.HTML(response.content)
+        :return: {url: title}
+        """
+        pending_games = {}
+        if tree is None:
+            return pending_games
+
+        decoder = json.JSONDecoder()
+        for script in xpaths.REACT_QUERY_STATE(tree):
+            try:
+                state, _ = decoder.raw_decode(script, script.index("{"))
+            except ValueError:
+                continue
+
+            # 深度优先遍历 保持文档顺序
+            stack = [state]
+            while stack:
+                node = stack.pop()
+                if isinstance(node, list):
+                    stack.extend(reversed(node))
+                    continue
+                if not isinstance(node, dict):
+                    continue
+                stack.extend(reversed(list(node.values())))
+
+                promotions = node.get("promotions")
+                if not isinstance(promotions, dict) or not node.get("title"):
+                    continue
+                discounts = [
+                    offer.get("discountSetting", {}).get("discountPercentage")
+                    for group in promotions.get("promotionalOffers") or []
+                    for offer in group.get("promotionalOffers") or []
+                ]
+                if 0 not in discounts:
+                    continue
+                mappings = (node.get("catalogNs") or {}).get("mappings") or []
+                slug = mappings[0].get("pageSlug") if mappings else None
+                slug = slug or (node.get("productSlug") or "").split("/")[0]
+                if slug:
+                    url = EpicAwesomeExplorer.URL_PRODUCT_PAGE + slug
+                    pending_games.setdefault(url, node["title"])
+
+        return pending_games
+
 
 class GameLibManager(EpicAwesomeExplorer):
     """游戏对象管理 缓存商城数据以及判断游戏在库状态"""
 
+    # 确认在库的按钮文本
+    OWNED_ASSERTS = ["已在游戏库中", "已在库中"]
+
     def __init__(self):
         super().__init__()
 
         self.action_name = "GameLibManager"
+        # 商城缓存快照 (st_mtime_ns, store)
+        self._store_snapshot = ()
+        # 已在库资源的本地账本
+        self.ledger = ClaimLedger(PATH_CLAIM_LEDGER, account=EPIC_EMAIL)
+
+    def _load_store(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """
+        读取商城缓存，文件未变更时复用内存中的解析结果
+
+        兼容旧版 `{category: {url: name}}` 格式的缓存文件。
+        :return: {category: {url: {"name": str, "first_seen": str, "last_seen": str}}}
+        """
+        try:
+            mtime = os.stat(self.path_free_games).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self._store_snapshot and self._store_snapshot[0] == mtime:
+            return self._store_snapshot[-1]
+
+        with open(self.path_free_games, "r", encoding="utf8") as file:
+            content = yaml.load(file, Loader=_YamlLoader)
+
+        store = {}
+        if isinstance(content, dict):
+            for category, entries in content.items():
+                if not isinstance(entries, dict):
+                    continue
+                store[category] = {
+                    url: entry
+                    if isinstance(entry, dict)
+                    else {"name": entry, "first_seen": "", "last_seen": ""}
+                    for url, entry in entries.items()
+                }
+        self._store_snapshot = (mtime, store)
+        return store
 
     def save_game_objs(self, game_objs: List[Dict[str, str]], category: str) -> None:
-        """缓存免费商城数据"""
+        """
+        缓存免费商城数据
+
+        按类别与链接合并到已有缓存中，不会覆盖其他类别的数据。
+        :param game_objs: [{"name": str, "url": str}, ...]
+        :param category: 缓存类别 self.category_details.keys()
+        :return:
+        """
         if not game_objs:
             return
 
-        content = {game_obj["url"]: game_obj["name"] for game_obj in game_objs}
-        with open(self.path_free_games, "w", encoding="utf8", newline="") as file:
-            yaml.dump({category: content}, file, allow_unicode=True)
+        store = copy.deepcopy(self._load_store())
+        entries = store.setdefault(category, {})
+        now = ToolBox.date_format_now()
+        qsize_new = 0
+        for game_obj in game_objs:
+            entry = entries.get(game_obj["url"])
+            if entry is None:
+                qsize_new += 1
+                entries[game_obj["url"]] = {
+                    "name": game_obj["name"],
+                    "first_seen": now,
+                    "last_seen": now,
+                }
+            else:
+                entry.update({"name": game_obj["name"], "last_seen": now})
+
+        ToolBox.atomic_write(
+            self.path_free_games,
+            yaml.dump(store, Dumper=_YamlDumper, allow_unicode=True),
+        )
+        self._store_snapshot = ()
 
         logger.success(
             ToolBox.runtime_report(
                 motive="SAVE",
                 action_name=self.action_name,
                 message="Cache Epic store information.",
+                category=category,
+                new=qsize_new,
+                total=len(entries),
             )
         )
 
@@ -247,33 +501,34 @@ class GameLibManager(EpicAwesomeExplorer):
 
         :param category:
         :param only_url:
-        :return:
+        :return: only_url=True [url, ...] | only_url=False [(url, name), ...]
         """
-        try:
-            with open(self.path_free_games, "r", encoding="utf8") as file:
-                content: Dict[str, Dict[str, str]] = yaml.load(file, Loader=yaml.Loader)
-        except FileNotFoundError:
+        entries = self._load_store().get(category)
+        if not entries:
             return []
-        else:
-            if not content or not isinstance(content, dict) or not content.get(category):
-                return []
-            if only_url:
-                return list(content[category].keys())
-            return list(content[category].items())
+        if only_url:
+            return list(entries.keys())
+        return [(url, entry["name"]) for url, entry in entries.items()]
 
     def is_my_game(
-        self, ctx_cookies: Union[List[dict], str], page_link: str
+        self, ctx_cookies: Union[List[dict], str], page_link: str, scraper=None
     ) -> Optional[dict]:
         """
         判断游戏在库状态
 
         :param ctx_cookies:
         :param page_link:
+        :param scraper: 复用的 HTTP 会话，缺省时使用进程共享的会话
         :return:
             None 异常状态
             True 跳过任务
             False 继续任务
         """
+        # 资源入库后不会被收回，命中账本时不再请求商品页
+        record = self.ledger.lookup(page_link)
+        if record is not None:
+            return {"assert": record["status"], "warning": "", "status": True}
+
         headers = {
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/100.0.4896.75 Safari/537.36 Edg/100.0.1185.36",
@@ -281,15 +536,14 @@ class GameLibManager(EpicAwesomeExplorer):
             if isinstance(ctx_cookies, str)
             else ToolBox.transfer_cookies(ctx_cookies),
         }
-        scraper = cloudscraper.create_scraper()
+        scraper = get_session() if scraper is None else scraper
         response = scraper.get(page_link, headers=headers)
-        tree = etree.HTML(response.content)
-        assert_obj = tree.xpath(
-            "//span[@data-component='PurchaseCTA']//span[@data-component='Message']"
-        )
+        response_obj = self.parse_purchase_status(etree.HTML(response.content))
+        if response_obj["assert"] in self.OWNED_ASSERTS:
+            self.ledger.record(page_link, response_obj["assert"])
 
         # 🚧 异常状态
-        if not assert_obj:
+        if response_obj["assert"] == "AssertObjectNotFound":
             logger.debug(
                 ToolBox.runtime_report(
                     motive="IGNORE",
@@ -298,6 +552,29 @@ class GameLibManager(EpicAwesomeExplorer):
                     url=page_link,
                 )
             )
+        # 🚧 出现遮挡警告且无法获取
+        elif response_obj["warning"] and response_obj["status"] is None:
+            logger.warning(
+                ToolBox.runtime_report(
+                    motive="SKIP",
+                    action_name=self.action_name,
+                    message=response_obj["warning"],
+                    url=page_link,
+                )
+            )
+
+        return response_obj
+
+    @staticmethod
+    def parse_purchase_status(tree) -> Dict[str, Optional[Union[str, bool]]]:
+        """
+        解析商品页的在库状态
+
+        :param tree: 商品页 etree.HTML
+        :return: {"assert": 按钮文本, "warning": 遮挡警告, "status": 同 is_my_game}
+        """
+        assert_obj = xpaths.PURCHASE_MESSAGE(tree)
+        if not assert_obj:
             return {"assert": "AssertObjectNotFound", "status": None}
 
         # [购买|获取|已在库中|即将推出]
@@ -312,7 +589,7 @@ class GameLibManager(EpicAwesomeExplorer):
             response_obj["status"] = False
         # 🍟 未领取的免费游戏
         elif assert_message in ["获取"]:
-            warning_obj = tree.xpath("//h1[@class='css-1gty6cv']//span")
+            warning_obj = xpaths.PURCHASE_WARNING(tree)
             # 出现遮挡警告
             if warning_obj:
                 warning_message = warning_obj[0].text
@@ -320,16 +597,6 @@ class GameLibManager(EpicAwesomeExplorer):
                 # 成人内容可获取
                 if "成人内容" in warning_message:
                     response_obj["status"] = False
-                else:
-                    logger.warning(
-                        ToolBox.runtime_report(
-                            motive="SKIP",
-                            action_name=self.action_name,
-                            message=warning_message,
-                            url=page_link,
-                        )
-                    )
-                    response_obj["status"] = None
             # 继续任务
             else:
                 response_obj["status"] = False
@@ -24,3 +24,7 @@ class Explorer(Exception):
 
 class DiscoveryTimeoutException(Explorer):
     """未能在规定时间内为指定玩家搜索免费游戏"""
+
+
+class DiscoveryParseException(Explorer):
+    """未能从商城页面中解析出免费游戏数据"""
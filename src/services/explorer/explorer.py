@@ -3,14 +3,16 @@
 # Author     : QIN2DIM
 # Github     : https://github.com/QIN2DIM
 # Description:
+import json
 from json.decoder import JSONDecodeError
-from typing import List, Optional, Union, Dict
+from typing import List, Optional, Union, Dict, Any, Iterator
 
-import cloudscraper
+from requests.exceptions import RequestException
 
-from services.utils import ToolBox, get_ctx
+from services.settings import logger
+from services.utils import ToolBox, get_ctx_pool, get_session
 from .core import EpicAwesomeExplorer, GameLibManager
-from .exceptions import DiscoveryTimeoutException
+from .exceptions import DiscoveryTimeoutException, DiscoveryParseException
 
 
 class Explorer(EpicAwesomeExplorer):
@@ -20,12 +22,17 @@ class Explorer(EpicAwesomeExplorer):
         super().__init__(silence=silence)
         self.action_name = "Explorer"
         self.game_manager = GameLibManager()
+        # 周免活动的起止时刻 ISO 8601
+        self.promotion_boundaries: List[str] = []
+        # 周免游戏的促销结束时刻 {pageLink: endDate}
+        self.promotion_deadlines: Dict[str, str] = {}
 
     def discovery_free_games(
         self,
         ctx_cookies: Optional[List[dict]] = None,
         cover: bool = True,
         category: str = "game",
+        by_browser: bool = False,
     ) -> Optional[List[str]]:
         """
         发现免费游戏。
@@ -36,24 +43,49 @@ class Explorer(EpicAwesomeExplorer):
         2. 但如果要查看免费游戏的在库状态，需要传 COOKIE 区分用户。
             - 有些游戏不同地区的玩家不一定都能玩。这个限制和账户地区信息有关，和当前访问的（代理）IP 无关。
             - 请确保传入的 COOKIE 是有效的。
+        3. 默认直接解析列表页，解析失败时才启动浏览器。
         :param category: 搜索模式 self.category.keys()
         :param cover:
         :param ctx_cookies: ToolBox.transfer_cookies(api.get_cookies())
+        :param by_browser: 跳过 HTTP 解析，直接使用浏览器搜索
         :return:
         """
         category = (
             "game" if category not in list(self.category_details.keys()) else category
         )
+        self.game_objs = {}
 
-        # 创建驱动上下文
-        with get_ctx(silence=self.silence) as ctx:
+        if not by_browser:
             try:
-                self._discovery_free_games(
-                    ctx=ctx, ctx_cookies=ctx_cookies, category=category
+                self._discovery_free_games_by_http(
+                    ctx_cookies=ctx_cookies, category=category
+                )
+            except (DiscoveryParseException, RequestException) as err:
+                logger.warning(
+                    ToolBox.runtime_report(
+                        motive="SWITCH",
+                        action_name=self.action_name,
+                        message="列表页解析失败，正在切换至浏览器搜索",
+                        error=str(err).strip(),
+                    )
                 )
+                by_browser = True
+                self.game_objs = {}
+
+        # 创建驱动上下文
+        if by_browser:
+            try:
+                with get_ctx_pool(silence=self.silence).ctx() as ctx:
+                    self._discovery_free_games(
+                        ctx=ctx, ctx_cookies=ctx_cookies, category=category
+                    )
+            # 归还驱动后再重试，避免驱动池满载时等待自身
             except DiscoveryTimeoutException:
                 return self.discovery_free_games(
-                    ctx_cookies=None, cover=cover, category=category
+                    ctx_cookies=None,
+                    cover=cover,
+                    category=category,
+                    by_browser=True,
                 )
 
         # 提取游戏平台对象
@@ -66,12 +98,180 @@ class Explorer(EpicAwesomeExplorer):
         # 返回链接
         return [game_obj.get("url") for game_obj in game_objs]
 
+    def iter_free_games(
+        self,
+        ctx_cookies: Optional[List[dict]] = None,
+        cover: bool = True,
+        category: str = "game",
+    ) -> Iterator[str]:
+        """
+        逐页发现免费游戏，每解析一页即产出该页的链接
+
+        供下游任务边搜集边消费，参数含义与 discovery_free_games 一致。
+        列表页解析失败时切换至浏览器搜索，仅产出尚未产出的链接。
+        :param ctx_cookies:
+        :param cover:
+        :param category:
+        :return:
+        """
+        category = (
+            "game" if category not in list(self.category_details.keys()) else category
+        )
+        self.game_objs = {}
+        _yielded = set()
+
+        try:
+            for game_objs in self._iter_free_games_by_http(
+                ctx_cookies=ctx_cookies, category=category
+            ):
+                for game_obj in game_objs:
+                    if game_obj["url"] not in _yielded:
+                        _yielded.add(game_obj["url"])
+                        yield game_obj["url"]
+        except (DiscoveryParseException, RequestException) as err:
+            logger.warning(
+                ToolBox.runtime_report(
+                    motive="SWITCH",
+                    action_name=self.action_name,
+                    message="列表页解析失败，正在切换至浏览器搜索",
+                    error=str(err).strip(),
+                )
+            )
+            for url in self.discovery_free_games(
+                ctx_cookies=ctx_cookies, cover=cover, category=category, by_browser=True
+            ):
+                if url not in _yielded:
+                    _yielded.add(url)
+                    yield url
+            return
+
+        if cover:
+            self.game_manager.save_game_objs(self.game_objs.values(), category=category)
+
+    def _load_promotions_cache(self) -> Dict[str, Any]:
+        """读取促销接口的 HTTP 缓存"""
+        try:
+            with open(self.path_promotions, "r", encoding="utf8") as file:
+                cache = json.load(file)
+        except (FileNotFoundError, JSONDecodeError):
+            return {}
+        if not isinstance(cache, dict) or cache.get("url") != self.URL_PROMOTIONS:
+            return {}
+        return cache
+
+    def _save_promotions_cache(
+        self,
+        response,
+        free_game_objs: Dict[str, Any],
+        boundaries: List[str],
+        deadlines: Dict[str, str],
+    ) -> None:
+        """缓存促销接口的校验字段以及解析结果"""
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if not etag and not last_modified:
+            return
+        cache = {
+            "url": self.URL_PROMOTIONS,
+            "etag": etag,
+            "last_modified": last_modified,
+            "promotions": free_game_objs,
+            "boundaries": boundaries,
+            "deadlines": deadlines,
+        }
+        ToolBox.atomic_write(
+            self.path_promotions, json.dumps(cache, ensure_ascii=False)
+        )
+
+    @staticmethod
+    def parse_promotions(data: Dict[str, Any]) -> Dict[str, Union[List[str], str]]:
+        """
+        解析促销接口的响应数据
+
+        :param data: response.json()
+        :return: {"urls": [], "pageLink1": "pageTitle1", "pageLink2": "pageTitle2", ...}
+        """
+        free_game_objs = {"urls": []}
+
+        elements = data["data"]["Catalog"]["searchStore"]["elements"]
+        promotions = [e for e in elements if e.get("promotions")]
+
+        # 获取商城促销数据
+        for promotion in promotions:
+            # 获取<本周免费>的游戏对象
+            if promotion["promotions"]["promotionalOffers"]:
+                url = (
+                    Explorer.URL_PRODUCT_PAGE
+                    + promotion["catalogNs"]["mappings"][0]["pageSlug"]
+                )
+                free_game_objs["urls"].append(url)
+                free_game_objs[url] = promotion["title"]
+
+        return free_game_objs
+
+    @staticmethod
+    def parse_promotion_deadlines(data: Dict[str, Any]) -> Dict[str, str]:
+        """
+        解析 <本周免费> 游戏的促销结束时刻
+
+        :param data: response.json()
+        :return: {pageLink: endDate} ISO 8601 时间字符串
+        """
+        deadlines = {}
+
+        elements = data["data"]["Catalog"]["searchStore"]["elements"]
+        for element in elements:
+            promotions = element.get("promotions") or {}
+            end_dates = [
+                offer["endDate"]
+                for offers in promotions.get("promotionalOffers") or []
+                for offer in offers.get("promotionalOffers") or []
+                if offer.get("endDate")
+            ]
+            if end_dates:
+                url = (
+                    Explorer.URL_PRODUCT_PAGE
+                    + element["catalogNs"]["mappings"][0]["pageSlug"]
+                )
+                deadlines[url] = min(end_dates)
+
+        return deadlines
+
+    @staticmethod
+    def parse_promotion_boundaries(data: Dict[str, Any]) -> List[str]:
+        """
+        解析周免活动的边界时刻
+
+        <本周免费> 的结束时刻以及 <即将推出> 的开始时刻，也即促销数据可能发生变化的时刻。
+        :param data: response.json()
+        :return: 升序排列的 ISO 8601 时间字符串
+        """
+        boundaries = set()
+
+        elements = data["data"]["Catalog"]["searchStore"]["elements"]
+        for element in elements:
+            promotions = element.get("promotions") or {}
+            for key, field in [
+                ("promotionalOffers", "endDate"),
+                ("upcomingPromotionalOffers", "startDate"),
+            ]:
+                for offers in promotions.get(key) or []:
+                    for offer in offers.get("promotionalOffers") or []:
+                        discount = offer.get("discountSetting") or {}
+                        if discount.get("discountPercentage") == 0 and offer.get(field):
+                            boundaries.add(offer[field])
+
+        return sorted(boundaries)
+
     def get_promotions(self, ctx_cookies: List[dict]) -> Dict[str, Union[List[str], str]]:
         """
         获取周免游戏数据
 
         <即将推出> promotion["promotions"]["upcomingPromotionalOffers"]
         <本周免费> promotion["promotions"]["promotionalOffers"]
+
+        携带上次响应的 ETag/Last-Modified 发起条件请求，
+        促销数据未变更（304）时直接返回缓存的解析结果。
         :param ctx_cookies:
         :return: {"urls": [], "pageLink1": "pageTitle1", "pageLink2": "pageTitle2", ...}
         """
@@ -81,34 +281,84 @@ class Explorer(EpicAwesomeExplorer):
             "Chrome/100.0.4896.75 Safari/537.36 Edg/100.0.1185.36",
             "cookie": ToolBox.transfer_cookies(ctx_cookies),
         }
-        scraper = cloudscraper.create_scraper()
-        response = scraper.get(self.URL_PROMOTIONS, headers=headers)
+        cache = self._load_promotions_cache()
+        if cache.get("etag"):
+            headers["if-none-match"] = cache["etag"]
+        if cache.get("last_modified"):
+            headers["if-modified-since"] = cache["last_modified"]
+
+        response = get_session().get(self.URL_PROMOTIONS, headers=headers)
+
+        if response.status_code == 304 and cache.get("promotions"):
+            logger.debug(
+                ToolBox.runtime_report(
+                    motive="CACHE",
+                    action_name=self.action_name,
+                    message="促销数据未变更，使用本地缓存",
+                )
+            )
+            self.promotion_boundaries = cache.get("boundaries", [])
+            self.promotion_deadlines = cache.get("deadlines", {})
+            return cache["promotions"]
 
         try:
             data = response.json()
         except JSONDecodeError:
             pass
         else:
-            elements = data["data"]["Catalog"]["searchStore"]["elements"]
-            promotions = [e for e in elements if e.get("promotions")]
-
-            # 获取商城促销数据
-            for promotion in promotions:
-                # 获取<本周免费>的游戏对象
-                if promotion["promotions"]["promotionalOffers"]:
-                    url = (
-                        self.URL_PRODUCT_PAGE
-                        + promotion["catalogNs"]["mappings"][0]["pageSlug"]
-                    )
-                    free_game_objs["urls"].append(url)
-                    free_game_objs[url] = promotion["title"]
+            free_game_objs = self.parse_promotions(data)
+            self.promotion_boundaries = self.parse_promotion_boundaries(data)
+            self.promotion_deadlines = self.parse_promotion_deadlines(data)
+            self._save_promotions_cache(
+                response,
+                free_game_objs,
+                self.promotion_boundaries,
+                self.promotion_deadlines,
+            )
 
         return free_game_objs
 
+    def get_promotions_by_store_home(self) -> Dict[str, Union[List[str], str]]:
+        """
+        不启动浏览器，解析商城首页的 <当前免费> 卡片以及内嵌的状态数据
+
+        :return: {"urls": [], "pageLink1": "pageTitle1", ...}
+        """
+        tree, response = ToolBox.handle_html(self.URL_STORE_HOME, allow_redirects=True)
+
+        pending_games = self.parse_stress_expressions(tree, response.url)
+        for url, title in self.parse_embedded_promotions(tree).items():
+            if url not in pending_games or pending_games[url] == "null":
+                pending_games[url] = title
+        if not pending_games:
+            raise DiscoveryParseException("未能从商城首页解析周免游戏")
+
+        free_game_objs = {"urls": []}
+        for url, title in pending_games.items():
+            free_game_objs[url] = title
+            free_game_objs["urls"].append(url)
+        return free_game_objs
+
     def get_promotions_by_stress_expressions(
         self, ctx_session=None
     ) -> Dict[str, Union[List[str], str]]:
-        """使用应力表达式萃取商品链接"""
+        """
+        使用应力表达式萃取商品链接
+
+        优先解析商城首页，解析失败时才使用浏览器。
+        """
+        try:
+            return self.get_promotions_by_store_home()
+        except (DiscoveryParseException, RequestException) as err:
+            logger.warning(
+                ToolBox.runtime_report(
+                    motive="SWITCH",
+                    action_name=self.action_name,
+                    message="商城首页解析失败，正在切换至浏览器搜索",
+                    error=str(err).strip(),
+                )
+            )
+
         free_game_objs = {"urls": []}
         if ctx_session:
             critical_memory = ctx_session.current_window_handle
@@ -118,7 +368,7 @@ class Explorer(EpicAwesomeExplorer):
             finally:
                 ctx_session.switch_to.window(critical_memory)
         else:
-            with get_ctx(silence=self.silence) as ctx:
+            with get_ctx_pool(silence=self.silence).ctx() as ctx:
                 pending_games: Dict[str, str] = self.stress_expressions(ctx=ctx)
 
         if pending_games:
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/5/10 20:31
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description: 本地认领账本
+import sqlite3
+import threading
+from hashlib import sha256
+from typing import Optional, Dict
+
+from services.utils import ToolBox
+
+
+class ClaimLedger:
+    """
+    已在库资源的本地账本
+
+    资源入库后不会被收回，已确认在库的资源直接命中账本，不再请求商城页面。
+    账本按账号隔离，切换账号后不会误用其他账号的在库记录。
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS owned ("
+        "account TEXT NOT NULL, "
+        "url TEXT NOT NULL, "
+        "status TEXT, "
+        "confirmed_at TEXT, "
+        "PRIMARY KEY (account, url))"
+    )
+
+    def __init__(self, path: str, account: str):
+        """
+
+        :param path: SQLite 数据库路径
+        :param account: 账号标识，仅保存其摘要
+        """
+        self.path = path
+        self.account = sha256(account.encode("utf8")).hexdigest()[:16]
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def normalize(url: str) -> str:
+        """剔除查询参数与末尾的斜杠"""
+        return url.split("?", maxsplit=1)[0].split("#", maxsplit=1)[0].rstrip("/")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(self.SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, url: str) -> Optional[Dict[str, str]]:
+        """
+        查询资源的在库记录
+
+        :param url: 商品页链接
+        :return: {"status", "confirmed_at"} 未记录时返回 None
+        """
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT status, confirmed_at FROM owned "
+                    "WHERE account = ? AND url = ?",
+                    (self.account, self.normalize(url)),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+        return {"status": row[0], "confirmed_at": row[1]}
+
+    def is_owned(self, url: str) -> bool:
+        return self.lookup(url) is not None
+
+    def record(self, url: str, status: str) -> None:
+        """
+        记录已确认在库的资源
+
+        :param url: 商品页链接
+        :param status: 在库状态文本，如 `已在库中`
+        :return:
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO owned (account, url, status, confirmed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (self.account, self.normalize(url), status, ToolBox.date_format_now()),
+            )
+            conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
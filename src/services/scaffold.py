@@ -5,8 +5,6 @@
 # Description:
 from typing import Optional
 
-from apis.scaffold import get, challenge, install, claimer
-
 
 class Scaffold:
     """系统脚手架 顶级接口指令"""
@@ -14,11 +12,15 @@ class Scaffold:
     @staticmethod
     def install(onnx_prefix: Optional[str] = None):
         """下载运行依赖"""
+        from apis.scaffold import install
+
         install.run(onnx_prefix=onnx_prefix)
 
     @staticmethod
     def test():
         """检查挑战者驱动版本是否适配"""
+        from apis.scaffold import install
+
         install.test()
 
     @staticmethod
@@ -39,6 +41,8 @@ class Scaffold:
         :param silence: (Default: True) IF False: 将在图形化系统中显式启动浏览器，演示人机挑战的执行过程。
         :return:
         """
+        from apis.scaffold import challenge
+
         challenge.run(silence=silence)
 
     @staticmethod
@@ -78,6 +82,8 @@ class Scaffold:
         :param debug: 显示栈追踪日志信息
         :return:
         """
+        from apis.scaffold import get
+
         category = "dlc" if bool(dlc) else "game"
         get.join(trace=debug, cache=cache, category=category)
 
@@ -101,6 +107,8 @@ class Scaffold:
         :param ignore: 忽略已在库的推送数据。
         :return:
         """
+        from apis.scaffold import claimer
+
         claimer.run(silence=silence, log_ignore=ignore, unreal=unreal)
 
     @staticmethod
@@ -109,12 +117,20 @@ class Scaffold:
         Scaffold.claim(silence=silence, ignore=ignore, unreal=True)
 
     @staticmethod
-    def deploy(platform: Optional[str] = None, unreal: Optional[bool] = False):
+    def deploy(
+        platform: Optional[str] = None,
+        unreal: Optional[bool] = False,
+        adaptive: Optional[bool] = False,
+    ):
         """
         部署系统定时任务。
 
         :param unreal: 虚幻商城月供砖家
         :param platform: 可选项 [vps serverless qing-long]
+        :param adaptive: 根据促销数据在周免活动切换后执行任务，空闲的周次不启动浏览器。
+            促销数据缺失时回退至每周五的定时任务。仅作用于 vps。
         :return:
         """
-        claimer.deploy(platform, unreal=unreal)
+        from apis.scaffold import claimer
+
+        claimer.deploy(platform, unreal=unreal, adaptive=adaptive)
@@ -21,9 +21,12 @@ __all__ = [
     "DIR_COOKIES",
     "DIR_TEMP_CACHE",
     "DIR_EXPLORER",
+    "DIR_LOG",
     "PATH_USR_COOKIES",
     "DIR_MODEL",
     "PATH_RAINBOW",
+    "PATH_NOTIFY_OUTBOX",
+    "PATH_CLAIM_LEDGER",
     # ------------------------------
     # CONFIG
     # ------------------------------
@@ -31,6 +34,7 @@ __all__ = [
     "EPIC_EMAIL",
     "MESSAGE_PUSHER_SETTINGS",
     "PLAYER",
+    "LOG_SETTINGS",
 ]
 __version__ = "0.3.3.dev"
 
@@ -62,13 +66,10 @@ DIR_TEMP_CACHE = join(PROJECT_DATABASE, "temp_cache")
 DIR_CHALLENGE = join(DIR_TEMP_CACHE, "_challenge")
 # 服务日志目录
 DIR_LOG = join(PROJECT_DATABASE, "logs")
-# ---------------------------------------------------
-# [√]服务器日志配置
-# ---------------------------------------------------
-logger = ToolBox.init_log(
-    error=join(DIR_LOG, "error.log"), runtime=join(DIR_LOG, "runtime.log")
-)
-
+# 已在库资源的本地账本
+PATH_CLAIM_LEDGER = join(PROJECT_DATABASE, "ledger.db")
+# 推送失败的消息 待下次运行时重新投递
+PATH_NOTIFY_OUTBOX = join(PROJECT_DATABASE, "notify_outbox.json")
 # ---------------------------------------------------
 # 路径补全
 # ---------------------------------------------------
@@ -112,6 +113,39 @@ PUSHER: Optional[Dict[str, Optional[str]]] = MESSAGE_PUSHER_SETTINGS.get("pusher
 # 匿名设置
 PLAYER: Optional[str] = MESSAGE_PUSHER_SETTINGS.get("player", "")
 # --------------------------------
+# [※] 日志配置
+# --------------------------------
+LOG_SETTINGS: Dict[str, Any] = config_.get("log_settings") or {}
+
+
+# --------------------------------
+# [√] 服务器日志配置
+# --------------------------------
+def init_log(enqueue: bool = True):
+    """
+    按日志配置初始化服务日志
+
+    gevent 接管线程后，此前启动的异步写入线程无法正常退出，
+    需在 monkey.patch_all() 之前以 enqueue=False 重新初始化。
+    :param enqueue: 文件日志是否异步写入
+    :return:
+    """
+    # JSON Lines 日志便于机器解析
+    path_serialize = join(DIR_LOG, "runtime.jsonl")
+    return ToolBox.init_log(
+        level=LOG_SETTINGS.get("level") or "DEBUG",
+        rotation=LOG_SETTINGS.get("rotation") or None,
+        retention=LOG_SETTINGS.get("retention") or "20 days",
+        compression=LOG_SETTINGS.get("compression") or None,
+        enqueue=enqueue,
+        error=join(DIR_LOG, "error.log"),
+        runtime=join(DIR_LOG, "runtime.log"),
+        serialize=path_serialize if LOG_SETTINGS.get("serialize") else "",
+    )
+
+
+logger = init_log()
+# --------------------------------
 # [※] 补全语法模板
 # --------------------------------
 if not EPIC_EMAIL:
@@ -3,19 +3,39 @@
 # Author     : QIN2DIM
 # Github     : https://github.com/QIN2DIM
 # Description:
-from .accelerator.core import AshFramework
-from .accelerator.core import CoroutineSpeedup
-from .armor.anti_hcaptcha.core import ArmorCaptcha
-from .armor.anti_hcaptcha.exceptions import (
-    LabelNotFoundException,
-    ChallengeReset,
-    ChallengeTimeout,
-)
-from .armor.anti_hcaptcha.solutions import sk_recognition
-from .armor.anti_hcaptcha.solutions.yolo import YOLO
-from .toolbox.toolbox import ToolBox
-from .toolbox.toolbox import get_challenge_ctx
-from .toolbox.toolbox import get_ctx
+import importlib
+
+# 按需加载工具组件，避免在启动时导入 selenium/cv2/skimage/aiohttp 等重量级依赖
+# {name: (module, attribute)} attribute 为 None 时导出模块本身
+_LAZY_EXPORTS = {
+    "AshFramework": (".accelerator.core", "AshFramework"),
+    "CoroutineSpeedup": (".accelerator.core", "CoroutineSpeedup"),
+    "ArmorCaptcha": (".armor.anti_hcaptcha.core", "ArmorCaptcha"),
+    "LabelNotFoundException": (
+        ".armor.anti_hcaptcha.exceptions",
+        "LabelNotFoundException",
+    ),
+    "ChallengeReset": (".armor.anti_hcaptcha.exceptions", "ChallengeReset"),
+    "ChallengeTimeout": (".armor.anti_hcaptcha.exceptions", "ChallengeTimeout"),
+    "sk_recognition": (".armor.anti_hcaptcha.solutions.sk_recognition", None),
+    "YOLO": (".armor.anti_hcaptcha.solutions.yolo", "YOLO"),
+    "MessageNotifier": (".notifier.core", "MessageNotifier"),
+    "NetworkSession": (".network.core", "NetworkSession"),
+    "get_session": (".network.core", "get_session"),
+    "close_session": (".network.core", "close_session"),
+    "rebase_urls": (".network.core", "rebase_urls"),
+    "xpaths": (".selector.xpaths", None),
+    "SpanTracer": (".tracer.core", "SpanTracer"),
+    "get_tracer": (".tracer.core", "get_tracer"),
+    "span": (".tracer.core", "span"),
+    "traced": (".tracer.core", "traced"),
+    "ToolBox": (".toolbox.toolbox", "ToolBox"),
+    "get_challenge_ctx": (".toolbox.toolbox", "get_challenge_ctx"),
+    "get_ctx": (".toolbox.toolbox", "get_ctx"),
+    "DriverPool": (".toolbox.pool", "DriverPool"),
+    "get_ctx_pool": (".toolbox.pool", "get_ctx_pool"),
+    "close_ctx_pool": (".toolbox.pool", "close_ctx_pool"),
+}
 
 __all__ = [
     "ToolBox",
@@ -29,4 +49,31 @@ __all__ = [
     "ChallengeTimeout",
     "YOLO",
     "sk_recognition",
+    "MessageNotifier",
+    "NetworkSession",
+    "get_session",
+    "close_session",
+    "rebase_urls",
+    "xpaths",
+    "SpanTracer",
+    "get_tracer",
+    "span",
+    "traced",
+    "DriverPool",
+    "get_ctx_pool",
+    "close_ctx_pool",
 ]
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attr = _LAZY_EXPORTS[name]
+    module = importlib.import_module(module_name, __name__)
+    value = module if attr is None else getattr(module, attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_EXPORTS))
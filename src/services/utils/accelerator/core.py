@@ -5,15 +5,31 @@
 # Description:
 import asyncio
 import os
-from typing import Optional, List, Union
+import sys
+import time
+from typing import Optional, List, Union, Dict, Any, Tuple, Iterable
 
-import aiohttp
 import gevent
 from gevent import queue
 
+# 协程退出信号
+_STOP = object()
+
 
 class CoroutineSpeedup:
-    """轻量化的协程控件"""
+    """
+    轻量化的协程控件
+
+    - 任务可由 docker 预载，也可由 producer 在协程运行期间流式投递（有界队列）
+    - 每个任务的执行结果、异常与耗时写入 self.done，speedup() 返回全部结果
+    - 支持整体超时与主动取消，未执行的任务记为 cancelled
+    - producer 抛出的异常在已投递的任务结束后由 speedup() 重新抛出
+    """
+
+    # 任务状态
+    TASK_DONE = "done"
+    TASK_ERROR = "error"
+    TASK_CANCELLED = "cancelled"
 
     def __init__(self, docker: Optional[List] = None, power: Optional[int] = None):
         # 任务容器：queue
@@ -25,8 +41,17 @@ class CoroutineSpeedup:
         # 协程数
         self.power = max(os.cpu_count(), 2) if power is None else power
 
-        # 任务队列满载时刻长度
+        # 任务队列满载时刻长度 流式投递时为已投递的任务数
         self.max_queue_size = 0
+        # 已启动的任务数
+        self.started = 0
+
+        self._cancelled = False
+        self._greenlets: List[gevent.Greenlet] = []
+        # 流式投递任务的协程
+        self._producer: Optional[gevent.Greenlet] = None
+        # 流式任务源抛出的异常
+        self._producer_error: Optional[BaseException] = None
 
     def progress(self) -> str:
         """
@@ -34,7 +59,7 @@ class CoroutineSpeedup:
 
         :return:
         """
-        _progress = self.max_queue_size - self.worker.qsize()
+        _progress = self.started
         return (
             "__pending__"
             if _progress < self.power
@@ -47,9 +72,27 @@ class CoroutineSpeedup:
 
         :return:
         """
-        while not self.worker.empty():
-            task = self.worker.get_nowait()
-            self.control_driver(task, *args, **kwargs)
+        while not self._cancelled:
+            task = self.worker.get()
+            if task is _STOP:
+                break
+            self.started += 1
+            self._execute(task, *args, **kwargs)
+
+    def _execute(self, task, *args, **kwargs):
+        """执行单个任务并记录结果"""
+        record = {"task": task, "status": self.TASK_DONE, "result": None, "error": None}
+        start = time.time()
+        try:
+            record["result"] = self.control_driver(task, *args, **kwargs)
+        except gevent.GreenletExit:
+            record["status"] = self.TASK_CANCELLED
+            raise
+        except Exception as err:  # noqa
+            record["status"], record["error"] = self.TASK_ERROR, err
+        finally:
+            record["elapsed"] = round(time.time() - start, 3)
+            self.done.put_nowait(record)
 
     def control_driver(self, task, *args, **kwargs):
         """
@@ -78,6 +121,38 @@ class CoroutineSpeedup:
                 self.worker.put_nowait(task)
         self.max_queue_size = self.worker.qsize()
 
+    def _produce(self, producer: Iterable, workers: int):
+        """流式投递任务，队列满载时等待协程消费"""
+        try:
+            for task in producer:
+                if self._cancelled:
+                    break
+                self.worker.put(task)
+                self.max_queue_size += 1
+        # 交由 speedup() 抛出，避免异常止步于协程
+        except Exception as err:  # noqa
+            self._producer_error = err
+        finally:
+            # 取消任务时由 cancel() 投递退出信号
+            if not self._cancelled:
+                for _ in range(workers):
+                    self.worker.put(_STOP)
+
+    def _drain(self):
+        """将队列中尚未执行的任务记为 cancelled"""
+        while not self.worker.empty():
+            task = self.worker.get_nowait()
+            if task is not _STOP:
+                self.done.put_nowait(
+                    {
+                        "task": task,
+                        "status": self.TASK_CANCELLED,
+                        "result": None,
+                        "error": None,
+                        "elapsed": 0,
+                    }
+                )
+
     def offload(self) -> list:
         """
         缓存卸载
@@ -89,113 +164,208 @@ class CoroutineSpeedup:
             docker.append(self.done.get())
         return docker
 
-    def killer(self):
+    def cancel(self, kill: bool = False):
         """
-        缓存回收
+        取消任务
 
+        :param kill: 是否中断正在执行的任务，否则等待其结束
         :return:
         """
+        self._cancelled = True
+        if kill:
+            gevent.killall(self._greenlets, block=False)
+            return
+        # 队列满载时 producer 阻塞于投递，停止投递并腾出队列
+        if self._producer is not None:
+            self._producer.kill(block=False)
+        self._drain()
+        # 唤醒等待任务的协程
+        for _ in range(self.power):
+            try:
+                self.worker.put_nowait(_STOP)
+            except queue.Full:
+                break
 
-    def speedup(self, *args, **kwargs):
+    def killer(self):
         """
-        框架接口
+        缓存回收
 
         :return:
         """
 
-        # 任务重载
-        self.overload()
+    def speedup(
+        self,
+        *args,
+        producer: Optional[Iterable] = None,
+        deadline: Optional[float] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        """
+        框架接口
 
-        # 弹出空载任务
-        if self.max_queue_size == 0:
-            return
+        :param producer: 流式任务源，指定后任务由协程边运行边消费，不再预载 docker
+        :param deadline: 整体超时，到期后中断所有任务
+        :return: [{"task", "status", "result", "error", "elapsed"}, ...]
+        """
+        self._cancelled, self.started, self._greenlets = False, 0, []
+        self._producer, self._producer_error = None, None
 
         # 粘性功率
-        power = kwargs.get("power")
+        power = kwargs.pop("power", None)
         self.power = self.power if power is None else power
-        self.power = (
-            self.max_queue_size if self.power > self.max_queue_size else self.power
-        )
+
+        if producer is None:
+            # 任务重载
+            self.overload()
+
+            # 弹出空载任务
+            if self.max_queue_size == 0:
+                return []
+
+            self.power = min(self.power, self.max_queue_size)
+            for _ in range(self.power):
+                self.worker.put_nowait(_STOP)
+        else:
+            # 有界队列 生产速度受协程消费速度约束
+            self.worker, self.max_queue_size = queue.Queue(maxsize=self.power * 2), 0
+            self._producer = gevent.spawn(self._produce, producer, self.power)
+            self._greenlets.append(self._producer)
 
         # 任务启动
-        task_list = []
         for _ in range(self.power):
-            task = gevent.spawn(self.launcher, *args, **kwargs)
-            task_list.append(task)
+            self._greenlets.append(gevent.spawn(self.launcher, *args, **kwargs))
         try:
-            gevent.joinall(task_list)
+            gevent.joinall(self._greenlets, timeout=deadline)
+            if any(not greenlet.dead for greenlet in self._greenlets):
+                self.cancel(kill=True)
+                gevent.joinall(self._greenlets)
         finally:
+            # 未执行的任务
+            self._drain()
             self.killer()
 
+        if self._producer_error is not None:
+            raise self._producer_error
+        return self.offload()
+
 
 class AshFramework:
-    """轻量化的协程控件"""
+    """
+    轻量化的协程控件
+
+    - 每个任务对应一个 asyncio.Task，以信号量限制并发数
+    - 支持单任务超时以及整体超时，超时的任务被取消并记为 asyncio.TimeoutError
+    - 按任务在 docker 中的序号收集返回值与异常
+    """
+
+    def __init__(
+        self,
+        docker: Optional[List] = None,
+        task_timeout: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ):
+        """
 
-    def __init__(self, docker: Optional[List] = None):
-        # 任务容器：queue
-        self.worker, self.done = asyncio.Queue(), asyncio.Queue()
+        :param docker: 任务上下文
+        :param task_timeout: 单个任务的超时
+        :param timeout: 整体超时，到期后取消尚未完成的任务
+        """
         # 任务容器
         self.docker = docker
-        # 任务队列满载时刻长度
+        self.task_timeout = task_timeout
+        self.timeout = timeout
+        # 执行结果 {任务序号: 返回值} {任务序号: 异常}
+        self.results: Dict[int, Any] = {}
+        self.exceptions: Dict[int, BaseException] = {}
+        # 任务总数 已结束的任务数
         self.max_queue_size = 0
+        self.finished = 0
 
     def progress(self) -> str:
         """任务进度"""
-        _progress = self.max_queue_size - self.worker.qsize()
-        return f"{_progress}/{self.max_queue_size}"
+        return f"{self.finished}/{self.max_queue_size}"
 
     def preload(self):
         """预处理"""
 
-    def overload(self):
+    def overload(self) -> List[Tuple[int, Any]]:
         """任务重载"""
-        if self.docker:
-            for task in self.docker:
-                self.worker.put_nowait(task)
-        self.max_queue_size = self.worker.qsize()
+        self.results, self.exceptions, self.finished = {}, {}, 0
+        tasks = list(enumerate(self.docker or []))
+        self.max_queue_size = len(tasks)
+        return tasks
 
-    def offload(self) -> Optional[List]:
-        """缓存卸载"""
-        crash = []
-        while not self.done.empty():
-            crash.append(self.done.get())
-        return crash
+    def offload(self) -> List:
+        """缓存卸载 按任务序号返回成功任务的返回值"""
+        return [self.results[index] for index in sorted(self.results)]
 
     async def control_driver(self, context, session=None):
         """需要并发执行的代码片段"""
         raise NotImplementedError
 
-    async def launcher(self, session=None):
-        """适配接口模式"""
-        while not self.worker.empty():
-            context = self.worker.get_nowait()
-            await self.control_driver(context, session=session)
+    async def launcher(self, index: int, context, semaphore, session=None):
+        """执行单个任务并记录其结果"""
+        try:
+            async with semaphore:
+                coro = self.control_driver(context, session=session)
+                if self.task_timeout:
+                    coro = asyncio.wait_for(coro, timeout=self.task_timeout)
+                self.results[index] = await coro
+        # 整体超时 尚未完成或仍在排队的任务被取消
+        except asyncio.CancelledError:
+            self.exceptions[index] = asyncio.TimeoutError()
+            raise
+        except Exception as err:  # noqa
+            self.exceptions[index] = err
+        finally:
+            self.finished += 1
 
-    async def subvert(self, workers: Union[str, int]):
+    async def subvert(self, workers: Union[str, int] = "fast") -> Dict[int, Any]:
         """
         框架接口
 
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(fl.go(workers))
+        asyncio.run(fl.subvert(workers))
 
-        :param workers: ["fast", power]
-        :return:
+        :param workers: ["fast", power] 最大并发数
+        :return: {任务序号: 返回值}
         """
         # 任务重载
-        self.overload()
+        tasks = self.overload()
 
         # 弹出空载任务
         if self.max_queue_size == 0:
-            return
+            return self.results
 
         # 粘性功率
         workers = self.max_queue_size if workers in ["fast"] else workers
-        workers = workers if workers <= self.max_queue_size else self.max_queue_size
+        workers = max(min(workers, self.max_queue_size), 1)
+        semaphore = asyncio.Semaphore(workers)
 
         # 弹性分发
-        task_list = []
+        import aiohttp
+
         async with aiohttp.ClientSession() as session:
-            for _ in range(workers):
-                task = self.launcher(session=session)
-                task_list.append(task)
-            await asyncio.wait(task_list)
+            pending = [
+                asyncio.ensure_future(
+                    self.launcher(index, context, semaphore, session=session)
+                )
+                for index, context in tasks
+            ]
+            _, pending = await asyncio.wait(pending, timeout=self.timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        return self.results
+
+    def run(self, workers: Union[str, int] = "fast") -> Dict[int, Any]:
+        """
+        在新的事件循环中执行任务
+
+        :param workers: ["fast", power] 最大并发数
+        :return: {任务序号: 返回值}
+        """
+        if "win" in sys.platform:
+            asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        return asyncio.run(self.subvert(workers=workers))
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/4/18 10:12
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description:
+import os
+import threading
+import time
+from typing import Optional, Tuple, Union, Dict
+from urllib.parse import urlparse
+
+import cloudscraper
+from loguru import logger
+from requests import Response
+from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
+
+from ..toolbox.toolbox import ToolBox
+
+
+class NetworkSession:
+    """
+    可复用的 HTTP 会话
+
+    - 基于 cloudscraper 保持 Cloudflare 的 TLS 指纹，复用 keep-alive 连接
+    - 限制单个主机的连接数，超出限制的请求等待空闲连接
+    - 缺省超时，对连接错误与网关错误退避重试
+    - 统计请求数、流量与耗时
+    """
+
+    def __init__(
+        self,
+        timeout: Union[float, Tuple[float, float]] = (5, 30),
+        pool_connections: int = 8,
+        pool_maxsize: int = 8,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+    ):
+        """
+
+        :param timeout: 缺省的 (connect, read) 超时，单次请求可通过 timeout 参数覆盖
+        :param pool_connections: 缓存的主机连接池数量
+        :param pool_maxsize: 单个主机的最大连接数
+        :param retries: 连接错误与 429/500/502/504 的最大重试次数
+        :param backoff_factor: 重试退避因子 {backoff factor} * (2 ** ({retry times} - 1))
+        """
+        self.timeout = timeout
+        self.scraper = cloudscraper.create_scraper()
+
+        # 重新初始化 cloudscraper 挂载的适配器，保留其 TLS 上下文
+        max_retries = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 504),
+            raise_on_status=False,
+        )
+        for adapter in self.scraper.adapters.values():
+            adapter.max_retries = max_retries
+            adapter.init_poolmanager(pool_connections, pool_maxsize, block=True)
+
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, Union[int, float]]] = {}
+        self.scraper.hooks["response"].append(self._tally)
+
+    def _stats_of(self, url: str) -> Dict[str, Union[int, float]]:
+        host = urlparse(url).netloc
+        if host not in self.stats:
+            self.stats[host] = {"requests": 0, "errors": 0, "bytes": 0, "elapsed": 0.0}
+        return self.stats[host]
+
+    def _tally(self, response: Response, *args, **kwargs) -> None:
+        """统计响应的流量与耗时"""
+        if kwargs.get("stream"):
+            size = int(response.headers.get("content-length", 0) or 0)
+        else:
+            size = len(response.content or b"")
+        with self._lock:
+            stats = self._stats_of(response.url)
+            stats["requests"] += 1
+            stats["bytes"] += size
+            stats["elapsed"] += response.elapsed.total_seconds()
+
+    def request(self, method: str, url: str, **kwargs) -> Response:
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            return self.scraper.request(method, url, **kwargs)
+        except RequestException:
+            with self._lock:
+                self._stats_of(url)["errors"] += 1
+            raise
+
+    def get(self, url: str, **kwargs) -> Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Response:
+        return self.request("POST", url, **kwargs)
+
+    def summary(self) -> Dict[str, Union[int, float]]:
+        """汇总所有主机的用量"""
+        with self._lock:
+            summary = {"requests": 0, "errors": 0, "bytes": 0, "elapsed": 0.0}
+            for stats in self.stats.values():
+                for key in summary:
+                    summary[key] += stats[key]
+        summary["elapsed"] = round(summary["elapsed"], 3)
+        return summary
+
+    def close(self) -> None:
+        self.scraper.close()
+
+
+def rebase_url(url: str, base_url: str) -> str:
+    """将链接的协议与主机替换为 base_url，保留路径与查询参数"""
+    parsed = urlparse(url)
+    query = f"?{parsed.query}" if parsed.query else ""
+    return f"{base_url.rstrip('/')}{parsed.path}{query}"
+
+
+def rebase_urls(cls=None, base_url: Optional[str] = None):
+    """
+    将类属性中的商城链接 `URL_*` 重定向至 base_url
+
+    缺省读取环境变量 `EPIC_BASE_URL`，未设置时不做任何修改。
+    可作为类装饰器，在导入服务模块前设置环境变量即可将整条链路指向本地替身服务器：
+
+    @rebase_urls
+    class Explorer: ...
+
+    :param cls:
+    :param base_url: 形如 http://127.0.0.1:8765
+    :return:
+    """
+    if cls is None:
+        return lambda klass: rebase_urls(klass, base_url=base_url)
+
+    base_url = os.getenv("EPIC_BASE_URL", "") if base_url is None else base_url
+    if not base_url:
+        return cls
+    for name, value in list(vars(cls).items()):
+        if name.startswith("URL_") and isinstance(value, str):
+            setattr(cls, name, rebase_url(value, base_url))
+    return cls
+
+
+_session: Optional[NetworkSession] = None
+_session_lock = threading.Lock()
+_session_start = 0.0
+
+
+def get_session() -> NetworkSession:
+    """获取当前进程共享的 HTTP 会话，在 close_session() 之前复用同一个连接池"""
+    global _session, _session_start
+    with _session_lock:
+        if _session is None:
+            _session = NetworkSession()
+            _session_start = time.time()
+        return _session
+
+
+def close_session() -> Optional[Dict[str, Union[int, float]]]:
+    """关闭共享的 HTTP 会话并输出本轮用量"""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is None:
+        return None
+
+    summary = session.summary()
+    session.close()
+    logger.debug(
+        ToolBox.runtime_report(
+            motive="STATS",
+            action_name="NetworkSession",
+            message="HTTP 会话已关闭",
+            lifetime=f"{round(time.time() - _session_start, 3)}s",
+            **summary,
+        )
+    )
+    return summary
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/5/8 11:02
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description:
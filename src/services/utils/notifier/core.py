@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/5/8 11:02
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description:
+import json
+import os
+import queue
+import threading
+import time
+from typing import Optional, Dict, List, Any
+
+from loguru import logger
+
+from ..toolbox.toolbox import ToolBox
+
+
+class MessageNotifier:
+    """
+    后台消息推送
+
+    - 复用同一个 Apprise 实例，每个推送渠道以 tag 区分
+    - 消息进入有界队列，由后台线程按渠道并行发送，单个渠道超时不阻塞其他渠道
+    - 发送失败的渠道连同消息写入发件箱，由下一次运行重新投递
+    """
+
+    def __init__(
+        self,
+        path_outbox: str,
+        maxsize: int = 16,
+        timeout: float = 30,
+        max_attempts: int = 5,
+    ):
+        """
+
+        :param path_outbox: 发件箱路径
+        :param maxsize: 待发送队列的长度上限，队列满载时消息直接写入发件箱
+        :param timeout: 单个渠道的发送超时
+        :param max_attempts: 消息的最大投递次数，超出后丢弃
+        """
+        self.action_name = "MessageNotifier"
+        self.path_outbox = path_outbox
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._apprise = None
+        self._channels: Dict[str, str] = {}
+        self._worker: Optional[threading.Thread] = None
+
+    def register(self, pusher: Dict[str, Optional[str]]) -> List[str]:
+        """
+        注册推送渠道，渠道配置不变时沿用已有的 Apprise 实例
+
+        :param pusher: {渠道名: Apprise URL}
+        :return: 可用的渠道名
+        """
+        import apprise
+
+        channels = {name: url for name, url in pusher.items() if url}
+        with self._lock:
+            if self._apprise is None or channels != self._channels:
+                surprise = apprise.Apprise()
+                for name, url in channels.items():
+                    surprise.add(url, tag=name)
+                self._apprise, self._channels = surprise, channels
+        return list(channels)
+
+    def submit(
+        self, body: str, title: str = "", channels: Optional[List[str]] = None
+    ) -> bool:
+        """
+        投递消息，不等待发送结果
+
+        :param body:
+        :param title:
+        :param channels: 目标渠道，缺省时发往所有已注册的渠道
+        :return: 消息是否进入待发送队列
+        """
+        message = {
+            "title": title,
+            "body": body,
+            "channels": list(self._channels) if channels is None else channels,
+            "attempts": 0,
+            "created_at": ToolBox.date_format_now(),
+        }
+        return self._enqueue(message)
+
+    def _enqueue(self, message: Dict[str, Any]) -> bool:
+        if not message["channels"]:
+            return False
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self._save_outbox([message])
+            logger.warning(
+                ToolBox.runtime_report(
+                    motive="DELAY",
+                    action_name=self.action_name,
+                    message="推送队列已满，消息转存至发件箱",
+                )
+            )
+            return False
+        return True
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name=self.action_name, daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            try:
+                if message is None:
+                    return
+                self._dispatch(message)
+            except Exception as err:  # noqa
+                logger.exception(err)
+            finally:
+                self._queue.task_done()
+
+    def _dispatch(self, message: Dict[str, Any]):
+        """按渠道并行发送，记录失败的渠道"""
+        message["attempts"] += 1
+        surprise, channels = self._apprise, message["channels"]
+        results: Dict[str, bool] = {}
+
+        def send(channel: str):
+            try:
+                results[channel] = bool(
+                    surprise.notify(
+                        body=message["body"], title=message["title"], tag=channel
+                    )
+                )
+            except Exception as err:  # noqa
+                results[channel] = False
+                logger.debug(
+                    ToolBox.runtime_report(
+                        motive="Notify",
+                        action_name=self.action_name,
+                        message="推送渠道异常",
+                        channel=channel,
+                        err=err,
+                    )
+                )
+
+        # 守护线程发送，超时的渠道视为发送失败，不再等待其结果
+        workers = [
+            threading.Thread(target=send, args=(channel,), daemon=True)
+            for channel in channels
+            if channel in self._channels
+        ]
+        for worker in workers:
+            worker.start()
+        deadline = time.monotonic() + self.timeout
+        for worker in workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+        failed = [channel for channel in channels if not results.get(channel)]
+
+        sent = [channel for channel in channels if channel not in failed]
+        if sent:
+            logger.success(
+                ToolBox.runtime_report(
+                    motive="Notify",
+                    action_name=self.action_name,
+                    message="消息推送完毕",
+                    active_pusher=sent,
+                )
+            )
+        if failed:
+            logger.warning(
+                ToolBox.runtime_report(
+                    motive="Notify",
+                    action_name=self.action_name,
+                    message="消息推送失败，转存至发件箱",
+                    failed_pusher=failed,
+                    attempts=message["attempts"],
+                )
+            )
+            self._save_outbox([{**message, "channels": failed}])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待待发送队列清空
+
+        :param timeout: 最长等待时间，缺省为单个渠道的发送超时加 5 秒
+        :return: 队列是否已清空
+        """
+        timeout = self.timeout + 5 if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def retry_outbox(self) -> int:
+        """
+        重新投递发件箱中的消息
+
+        :return: 重新进入待发送队列的消息数
+        """
+        with self._lock:
+            messages = self._load_outbox()
+            if not messages:
+                return 0
+            self._write_outbox([])
+
+        retry, expired = [], []
+        for message in messages:
+            if message.get("attempts", 0) >= self.max_attempts:
+                expired.append(message)
+            else:
+                retry.append(message)
+        if expired:
+            logger.warning(
+                ToolBox.runtime_report(
+                    motive="DROP",
+                    action_name=self.action_name,
+                    message="丢弃多次投递失败的消息",
+                    count=len(expired),
+                )
+            )
+        return sum(self._enqueue(message) for message in retry)
+
+    def _load_outbox(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.path_outbox, "r", encoding="utf8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return []
+
+    def _write_outbox(self, messages: List[Dict[str, Any]]):
+        if not messages and not os.path.exists(self.path_outbox):
+            return
+        ToolBox.atomic_write(
+            self.path_outbox, json.dumps(messages, ensure_ascii=False, indent=2)
+        )
+
+    def _save_outbox(self, messages: List[Dict[str, Any]]):
+        with self._lock:
+            self._write_outbox(self._load_outbox() + messages)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/5/14 10:20
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description: 商城页面的 lxml 选择器
+"""
+预编译的 lxml 选择器
+
+解析热路径直接调用 XPath 对象，不再在每次调用时重新编译表达式；
+商城页面结构改变时只需在此处更新选择器。
+Selenium 的元素定位器仍与浏览器操作放在一起，不在此处维护。
+
+用法：xpaths.PURCHASE_MESSAGE(tree) -> List[Element]
+"""
+
+from lxml import etree
+
+# ---------------------------------------------------
+# 通用
+# ---------------------------------------------------
+# 节点的全部文本
+STRING = etree.XPath("string()", smart_strings=False)
+
+# ---------------------------------------------------
+# 免费商城列表页
+# ---------------------------------------------------
+# 游戏卡片 aria-label="{name}, ..." href="/zh-CN/p/{slug}"
+FREE_GAME_CARDS = etree.XPath("//a[@class='css-1jx3eyg']")
+# 翻页按钮的链接
+PAGINATION_HREFS = etree.XPath(
+    "//a[@data-component='PaginationItem']/@href", smart_strings=False
+)
+
+# ---------------------------------------------------
+# 商城首页
+# ---------------------------------------------------
+# <当前免费> 卡片
+FREE_NOW_CARDS = etree.XPath("//a[contains(string(),'当前免费')]")
+# 卡片内的商品名称 以卡片为上下文节点
+OFFER_TITLE = etree.XPath(".//span[@data-testid='offer-title-info-title']")
+# 内嵌的状态数据
+REACT_QUERY_STATE = etree.XPath(
+    "//script[contains(text(),'__REACT_QUERY_INITIAL_QUERIES__')]/text()",
+    smart_strings=False,
+)
+
+# ---------------------------------------------------
+# 商品页
+# ---------------------------------------------------
+# 购买按钮文本 [购买|获取|已在库中|即将推出]
+PURCHASE_MESSAGE = etree.XPath(
+    "//span[@data-component='PurchaseCTA']//span[@data-component='Message']"
+)
+# 遮挡警告 如成人内容
+PURCHASE_WARNING = etree.XPath("//h1[@class='css-1gty6cv']//span")
+# 附加内容入口
+DLC_ENTRY = etree.XPath(
+    "//li[@data-component='PDPTertiaryNavigation']//a[contains(@href,'dlc')]"
+)
+
+# ---------------------------------------------------
+# 附加内容列表页
+# ---------------------------------------------------
+DLC_NOT_FOUND = etree.XPath("//span[text()='未找到结果']")
+DLC_CARDS = etree.XPath("//div[@data-component='DiscoverCard']//a")
+
+# ---------------------------------------------------
+# 购物车
+# ---------------------------------------------------
+CART_EMPTY = etree.XPath("//span[text()='您的购物车是空的。']")
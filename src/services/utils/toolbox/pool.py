@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/5/12 21:40
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description: 浏览器驱动上下文池
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Callable, List, Dict, Any
+
+from loguru import logger
+
+from .toolbox import ToolBox, get_ctx
+
+
+class DriverPool:
+    """
+    可复用的浏览器驱动上下文池
+
+    - 租借空闲的驱动，归还后供同一轮任务中的其他调用方复用，避免重复冷启动 Chrome
+    - 租借前检查驱动是否存活，失效的驱动直接回收
+    - 驱动使用次数达到上限后回收重建，避免长时间运行的浏览器积累内存
+    - 租借数达到上限时等待其他调用方归还
+    """
+
+    def __init__(
+        self,
+        factory: Optional[Callable[[], Any]] = None,
+        maxsize: int = 4,
+        max_uses: int = 20,
+        silence: Optional[bool] = None,
+    ):
+        """
+
+        :param factory: 驱动构造函数，缺省使用 get_ctx
+        :param maxsize: 同时存在的驱动数上限
+        :param max_uses: 单个驱动的最大租借次数
+        :param silence:
+        """
+        self.factory = factory or (lambda: get_ctx(silence=silence))
+        self.maxsize = max(maxsize, 1)
+        self.max_uses = max(max_uses, 1)
+
+        self._cond = threading.Condition()
+        self._idle: List[Any] = []
+        # 池中全部驱动的租借次数 {id(ctx): [ctx, uses]}
+        self._drivers: Dict[int, list] = {}
+        # 正在启动的驱动数
+        self._starting = 0
+        self._closed = False
+        self.stats = {"created": 0, "reused": 0, "recycled": 0}
+
+    @staticmethod
+    def is_alive(ctx) -> bool:
+        """驱动健康检查 浏览器崩溃或会话失效时返回 False"""
+        try:
+            return bool(ctx.window_handles)
+        except Exception:  # noqa
+            return False
+
+    @staticmethod
+    def _quit(ctx) -> None:
+        try:
+            ctx.quit()
+        except Exception:  # noqa
+            pass
+
+    @staticmethod
+    def _reset(ctx) -> None:
+        """清理租借期间遗留的标签页与身份令牌"""
+        handles = ctx.window_handles
+        for handle in handles[1:]:
+            ctx.switch_to.window(handle)
+            ctx.close()
+        ctx.switch_to.window(handles[0])
+        ctx.delete_all_cookies()
+
+    def _discard(self, ctx) -> None:
+        """回收驱动 需持有锁"""
+        self._drivers.pop(id(ctx), None)
+        self.stats["recycled"] += 1
+        self._cond.notify()
+
+    def lease(self, timeout: Optional[float] = None):
+        """
+        租借驱动
+
+        :param timeout: 等待空闲驱动的超时，缺省一直等待
+        :return: 驱动上下文，使用完毕后需通过 release() 归还
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("DriverPool is closed")
+                # 优先复用最近归还的驱动
+                while self._idle:
+                    ctx = self._idle.pop()
+                    if self.is_alive(ctx):
+                        self._drivers[id(ctx)][-1] += 1
+                        self.stats["reused"] += 1
+                        return ctx
+                    self._discard(ctx)
+                    self._quit(ctx)
+                if len(self._drivers) + self._starting < self.maxsize:
+                    self._starting += 1
+                    break
+                if not self._cond.wait(timeout):
+                    raise TimeoutError("No idle driver in DriverPool")
+
+        try:
+            ctx = self.factory()
+        except BaseException:
+            with self._cond:
+                self._starting -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._starting -= 1
+            closed = self._closed
+            if not closed:
+                self._drivers[id(ctx)] = [ctx, 1]
+                self.stats["created"] += 1
+        # 启动期间驱动池已关闭
+        if closed:
+            self._quit(ctx)
+            raise RuntimeError("DriverPool is closed")
+        return ctx
+
+    def release(self, ctx, broken: bool = False) -> None:
+        """
+        归还驱动
+
+        :param ctx: lease() 租借的驱动
+        :param broken: 驱动已处于异常状态，直接回收
+        :return:
+        """
+        if not broken:
+            try:
+                self._reset(ctx)
+            except Exception:  # noqa
+                broken = True
+
+        with self._cond:
+            uses = self._drivers.get(id(ctx), [ctx, self.max_uses])[-1]
+            retire = broken or self._closed or uses >= self.max_uses
+            if retire:
+                self._discard(ctx)
+            else:
+                self._idle.append(ctx)
+                self._cond.notify()
+        if retire:
+            self._quit(ctx)
+
+    @contextmanager
+    def ctx(self, timeout: Optional[float] = None):
+        """
+        以上下文管理器的形式租借驱动
+
+        with pool.ctx() as ctx:
+            ctx.get(url)
+
+        :param timeout: 等待空闲驱动的超时
+        :return:
+        """
+        from selenium.common.exceptions import WebDriverException
+
+        ctx = self.lease(timeout=timeout)
+        broken = False
+        try:
+            yield ctx
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self.release(ctx, broken=broken)
+
+    def close(self) -> None:
+        """关闭池中全部驱动，包括尚未归还的驱动"""
+        with self._cond:
+            self._closed = True
+            drivers = [driver[0] for driver in self._drivers.values()]
+            self._idle, self._drivers = [], {}
+            self._cond.notify_all()
+        for ctx in drivers:
+            self._quit(ctx)
+
+
+_pool: Optional[DriverPool] = None
+_pool_lock = threading.Lock()
+_pool_start = 0.0
+
+
+def get_ctx_pool(silence: Optional[bool] = None) -> DriverPool:
+    """获取当前进程共享的驱动池，在 close_ctx_pool() 之前复用已启动的浏览器"""
+    global _pool, _pool_start
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool(silence=silence)
+            _pool_start = time.time()
+        return _pool
+
+
+def close_ctx_pool() -> Optional[Dict[str, int]]:
+    """关闭共享的驱动池并输出本轮用量"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is None:
+        return None
+
+    pool.close()
+    logger.debug(
+        ToolBox.runtime_report(
+            motive="STATS",
+            action_name="DriverPool",
+            message="驱动池已关闭",
+            lifetime=f"{round(time.time() - _pool_start, 3)}s",
+            **pool.stats,
+        )
+    )
+    return pool.stats
+
+
+# 异常退出时同样回收浏览器进程
+atexit.register(close_ctx_pool)
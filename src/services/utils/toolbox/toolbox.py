@@ -4,27 +4,63 @@
 # Github     : https://github.com/QIN2DIM
 # Description:
 import os
+import queue
 import shutil
 import sys
+import tempfile
 from datetime import datetime, timedelta
 from typing import List, Union, Dict, Optional, Any
 
-import cloudscraper
 import pytz
-import undetected_chromedriver as uc
 import yaml
-from gevent.queue import Queue
 from loguru import logger
 from lxml import etree
-from selenium.webdriver import Chrome
-from selenium.webdriver import ChromeOptions
-from webdriver_manager.chrome import ChromeDriverManager
+
+from ..tracer.core import span
+
+
+class _RuntimeReport:
+    """
+    延迟格式化的运行报告
+
+    loguru 在日志等级通过过滤后才调用 str(message)，被过滤的报告不会被格式化，
+    也不会写入 ToolBox.logger_tracer。
+    """
+
+    __slots__ = ("action_name", "motive", "message", "params", "_text")
+
+    def __init__(self, action_name: str, motive: str, message: str, params: dict):
+        self.action_name = action_name
+        self.motive = motive
+        self.message = message
+        self.params = params
+        self._text = None
+
+    def __str__(self) -> str:
+        if self._text is None:
+            flag_ = f">> {self.motive} [{self.action_name}]"
+            if self.message != "":
+                flag_ += f" {self.message}"
+            if self.params:
+                flag_ += " - "
+                flag_ += " ".join([f"{i[0]}={i[1]}" for i in self.params.items()])
+            self._text = flag_
+
+            # 将系统级日志按序插入消息队列
+            ToolBox.trace(flag_)
+        return self._text
+
+    __repr__ = __str__
+
+    def __format__(self, format_spec: str) -> str:
+        return format(str(self), format_spec)
 
 
 class ToolBox:
     """可移植的工具箱"""
 
-    logger_tracer = Queue()
+    # 最近输出的系统级日志 队列满载时丢弃最早的记录
+    logger_tracer = queue.Queue(maxsize=1024)
 
     @staticmethod
     def check_sample_yaml(path_output: str, path_sample: str) -> Optional[Dict[str, Any]]:
@@ -67,19 +103,22 @@ class ToolBox:
     @staticmethod
     def runtime_report(
         action_name: str, motive: str = "RUN", message: str = "", **params
-    ) -> str:
-        """格式化输出"""
-        flag_ = f">> {motive} [{action_name}]"
-        if message != "":
-            flag_ += f" {message}"
-        if params:
-            flag_ += " - "
-            flag_ += " ".join([f"{i[0]}={i[1]}" for i in params.items()])
+    ) -> _RuntimeReport:
+        """格式化输出 在日志实际输出时才格式化，str() 得到报告文本"""
+        return _RuntimeReport(action_name, motive, message, params)
 
-        # 将系统级日志按序插入消息队列
-        ToolBox.logger_tracer.put_nowait(flag_)
-
-        return flag_
+    @staticmethod
+    def trace(flag_: str) -> None:
+        """记录系统级日志，队列满载时丢弃最早的记录"""
+        while True:
+            try:
+                ToolBox.logger_tracer.put_nowait(flag_)
+                return
+            except queue.Full:
+                try:
+                    ToolBox.logger_tracer.get_nowait()
+                except queue.Empty:
+                    pass
 
     @staticmethod
     def transfer_cookies(
@@ -135,19 +174,75 @@ class ToolBox:
         return f"{secrets_prefix}@{suffix}" if domain else secrets_prefix
 
     @staticmethod
-    def init_log(**sink_path):
-        """初始化 loguru 日志信息"""
+    def atomic_write(path: str, content: Union[str, bytes]) -> None:
+        """
+        原子写入文件
+
+        先写入同目录下的临时文件再替换目标文件，写入中断时不会损坏原有数据。
+        :param path: 目标文件路径
+        :param content: 文件内容
+        :return:
+        """
+        binary = isinstance(content, bytes)
+        fd, path_temp = tempfile.mkstemp(
+            prefix=f".{os.path.basename(path)}.", dir=os.path.dirname(path) or "."
+        )
+        try:
+            if binary:
+                file = os.fdopen(fd, "wb")
+            else:
+                file = os.fdopen(fd, "w", encoding="utf8", newline="")
+            with file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(path_temp, path)
+        except BaseException:
+            if os.path.exists(path_temp):
+                os.remove(path_temp)
+            raise
+
+    @staticmethod
+    def init_log(
+        level: str = "DEBUG",
+        rotation: Optional[str] = None,
+        retention: Optional[str] = "20 days",
+        compression: Optional[str] = None,
+        enqueue: bool = True,
+        **sink_path,
+    ):
+        """
+        初始化 loguru 日志信息
+
+        文件日志经由队列在后台线程写入，切分与压缩不会阻塞调用方。
+        :param level: 控制台、runtime 与 serialize 日志的最低等级
+        :param rotation: 文件日志的切分条件，如 "20 MB" "1 week" "00:00"，
+            缺省时 error 按周切分，runtime 按 20 MB 切分
+        :param retention: 切分后的日志保留时长，如 "20 days" "10 files"
+        :param compression: 切分后的日志压缩格式，如 "zip" "gz"
+        :param enqueue: 文件日志是否异步写入
+        :param sink_path: error | runtime | serialize 日志路径，serialize 输出 JSON Lines
+        :return:
+        """
         event_logger_format = (
             "<g>{time:YYYY-MM-DD HH:mm:ss}</g> | "
             "<lvl>{level}</lvl> - "
             # "<c><u>{name}</u></c> | "
             "{message}"
         )
+        file_options = {
+            "retention": retention,
+            "compression": compression or None,
+            "enqueue": enqueue,
+            "encoding": "utf8",
+            "diagnose": False,
+        }
         logger.remove()
+        # 控制台日志保持同步输出，与 print() 的顺序一致
         logger.add(
             sink=sys.stdout,
             colorize=True,
-            level="DEBUG",
+            level=level,
             format=event_logger_format,
             diagnose=False,
         )
@@ -155,37 +250,47 @@ class ToolBox:
             logger.add(
                 sink=sink_path.get("error"),
                 level="ERROR",
-                rotation="1 week",
-                encoding="utf8",
-                diagnose=False,
+                rotation=rotation or "1 week",
+                **file_options,
             )
         if sink_path.get("runtime"):
             logger.add(
                 sink=sink_path.get("runtime"),
-                level="DEBUG",
-                rotation="20 MB",
-                retention="20 days",
-                encoding="utf8",
-                diagnose=False,
+                level=level,
+                rotation=rotation or "20 MB",
+                **file_options,
+            )
+        if sink_path.get("serialize"):
+            logger.add(
+                sink=sink_path.get("serialize"),
+                level=level,
+                rotation=rotation or "20 MB",
+                serialize=True,
+                **file_options,
             )
         return logger
 
     @staticmethod
-    def handle_html(url_, cookie: str = None, allow_redirects=False):
+    def handle_html(url_, cookie: str = None, allow_redirects=False, scraper=None):
         headers = {
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/100.0.4896.75 Safari/537.36 Edg/100.0.1185.36"
         }
         if cookie is not None and isinstance(cookie, str):
             headers.update({"cookie": cookie})
-        scraper = cloudscraper.create_scraper()
+        if scraper is None:
+            from ..network.core import get_session
+
+            scraper = get_session()
         response_ = scraper.get(url_, headers=headers, allow_redirects=allow_redirects)
         tree_ = etree.HTML(response_.content)
         return tree_, response_
 
 
-def _set_ctx(language: Optional[str] = None) -> ChromeOptions:
+def _set_ctx(language: Optional[str] = None):
     """统一的 ChromeOptions 启动参数"""
+    from selenium.webdriver import ChromeOptions
+
     options = ChromeOptions()
     options.add_argument("--log-level=3")
     options.add_argument("--disable-dev-shm-usage")
@@ -200,6 +305,8 @@ def _set_ctx(language: Optional[str] = None) -> ChromeOptions:
 
 def get_ctx(silence: Optional[bool] = None):
     """普通的 Selenium 驱动上下文，用于常规并发任务"""
+    from selenium.webdriver import Chrome
+    from webdriver_manager.chrome import ChromeDriverManager
 
     silence = True if silence is None or "linux" in sys.platform else silence
 
@@ -210,23 +317,28 @@ def get_ctx(silence: Optional[bool] = None):
         options.add_argument("--disable-software-rasterizer")
 
     # 使用 ChromeDriverManager 托管服务，自动适配浏览器驱动
-    return Chrome(ChromeDriverManager(log_level=0).install(), options=options)
+    with span("driver_startup"):
+        return Chrome(ChromeDriverManager(log_level=0).install(), options=options)
 
 
 def get_challenge_ctx(silence: Optional[bool] = None):
     """挑战者驱动 用于处理人机挑战"""
+    import undetected_chromedriver as uc
+    from webdriver_manager.chrome import ChromeDriverManager
+
     logger.debug(ToolBox.runtime_report("__Context__", "ACTIVATE", "🎮 激活挑战者上下文"))
 
     silence = True if silence is None or "linux" in sys.platform else silence
 
     # 控制挑战者驱动版本，避免过于超前
     options = _set_ctx()
-    try:
-        return uc.Chrome(
-            headless=silence,
-            options=options,
-            driver_executable_path=ChromeDriverManager(log_level=0).install(),
-        )
-    # 避免核心并行
-    except OSError:
-        return uc.Chrome(headless=silence, options=options)
+    with span("driver_startup"):
+        try:
+            return uc.Chrome(
+                headless=silence,
+                options=options,
+                driver_executable_path=ChromeDriverManager(log_level=0).install(),
+            )
+        # 避免核心并行
+        except OSError:
+            return uc.Chrome(headless=silence, options=options)
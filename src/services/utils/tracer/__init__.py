@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/4/20 9:41
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description:
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# Time       : 2022/4/20 9:41
+# Author     : QIN2DIM
+# Github     : https://github.com/QIN2DIM
+# Description: 轻量化的阶段耗时追踪
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+
+class SpanTracer:
+    """按阶段汇总一次运行的耗时与计数"""
+
+    def __init__(self, name: str = "run"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._counters: Dict[str, int] = {}
+        self._started_at = datetime.now().astimezone()
+        self._perf_start = time.perf_counter()
+
+    def reset(self, name: Optional[str] = None):
+        """开启新一轮运行，清空已记录的数据"""
+        with self._lock:
+            self.name = self.name if name is None else name
+            self._stages, self._counters = {}, {}
+            self._started_at = datetime.now().astimezone()
+            self._perf_start = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage: str):
+        """
+        记录代码块的耗时
+
+        同一线程内递归进入的同名阶段只计数，不重复累计耗时。
+        :param stage: 阶段名
+        :return:
+        """
+        active = self._local.__dict__.setdefault("active", [])
+        nested = stage in active
+        active.append(stage)
+        error = False
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            elapsed = 0.0 if nested else time.perf_counter() - start
+            active.pop()
+            self._record(stage, elapsed, error)
+
+    def incr(self, counter: str, value: int = 1):
+        """累加计数器"""
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def _record(self, stage: str, elapsed: float, error: bool):
+        with self._lock:
+            stats = self._stages.setdefault(
+                stage, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0}
+            )
+            stats["count"] += 1
+            stats["errors"] += int(error)
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+
+    def report(self) -> Dict[str, Any]:
+        """生成耗时报告 单位：秒"""
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "total": round(stats["total"], 3),
+                    "avg": round(stats["total"] / stats["count"], 3),
+                    "max": round(stats["max"], 3),
+                }
+                for stage, stats in self._stages.items()
+            }
+            return {
+                "name": self.name,
+                "started_at": self._started_at.isoformat(timespec="seconds"),
+                "elapsed": round(time.perf_counter() - self._perf_start, 3),
+                "stages": stages,
+                "counters": dict(self._counters),
+            }
+
+    def dump(self, path: str) -> Dict[str, Any]:
+        """
+        将耗时报告以 JSON Lines 格式追加至文件
+
+        :param path: 报告路径
+        :return: 耗时报告
+        """
+        report = self.report()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf8") as file:
+            file.write(json.dumps(report, ensure_ascii=False) + "\n")
+        return report
+
+
+_tracer = SpanTracer()
+
+
+def get_tracer() -> SpanTracer:
+    """进程内共用的追踪器"""
+    return _tracer
+
+
+def span(stage: str):
+    """在共用追踪器上记录阶段耗时"""
+    return _tracer.span(stage)
+
+
+def traced(stage: str):
+    """以装饰器的形式记录函数耗时"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _tracer.span(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator